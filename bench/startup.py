@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Measures the time to import FFC and the JIT module in a fresh
+interpreter, which short-lived processes loading modules from the JIT
+cache pay on every start."""
+
+import subprocess
+import sys
+import time
+
+statements = ["pass",
+              "import ffc",
+              "import ffc.codegeneration.jit",
+              "import ffc.compiler"]
+
+num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+for statement in statements:
+    timings = []
+    for i in range(num_runs):
+        t = time.time()
+        subprocess.check_call([sys.executable, "-c", statement])
+        timings.append(time.time() - t)
+    print("{:32s} {:8.3f} s (best of {})".format(statement, min(timings), num_runs))
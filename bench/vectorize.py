@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Measures the throughput of tabulate_tensor generated with and
+without the vectorize parameter, for weighted Laplace operators of
+increasing degree. Pass compiler flags as first argument, e.g.
+"-O3 -march=native" to allow AVX and FMA instructions."""
+
+import sys
+import time
+
+import numpy as np
+
+import ffc.codegeneration.jit
+import ufl
+
+flags = sys.argv[1] if len(sys.argv) > 1 else "-O3 -march=native"
+num_calls = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+cases = [(ufl.triangle, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2]),
+         (ufl.quadrilateral, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2, 1.3, 1.1]),
+         (ufl.tetrahedron, [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.1, 0.2, 1.1])]
+
+for cell, coordinate_dofs in cases:
+    for degree in (2, 3, 4):
+        element = ufl.FiniteElement("Lagrange", cell, degree)
+        u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+        g = ufl.Coefficient(element)
+        a = g * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+        timings = []
+        for vectorize in (False, True):
+            parameters = {"vectorize": vectorize, "cpp_optimize_flags": flags}
+            compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+            integral = compiled_forms[0][0].create_cell_integral(-1)
+            ffi = module.ffi
+
+            A = np.zeros(10000)
+            w = np.linspace(1.0, 2.0, 1000)
+            coords = np.array(coordinate_dofs)
+            args = (ffi.cast("double *", A.ctypes.data), ffi.cast("double *", w.ctypes.data),
+                    ffi.cast("double *", coords.ctypes.data), 0)
+
+            tabulate_tensor = integral.tabulate_tensor
+            t = time.time()
+            for i in range(num_calls):
+                tabulate_tensor(*args)
+            timings.append((time.time() - t) / num_calls)
+
+        print("{:14s} P{}  scalar {:8.2f} us  vectorized {:8.2f} us  speedup {:5.2f}".format(
+            cell.cellname(), degree, 1e6 * timings[0], 1e6 * timings[1],
+            timings[0] / timings[1]))
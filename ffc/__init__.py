@@ -18,11 +18,18 @@ The interface consists of the following functions:
 """
 
 import logging
-import pkg_resources
+import sys
 
-from FIAT import supported_elements
+try:
+    from importlib.metadata import version as _distribution_version
+except ImportError:
+    # Python < 3.8, pkg_resources is much slower to import
+    import pkg_resources
 
-__version__ = pkg_resources.get_distribution("fenics-ffc").version
+    def _distribution_version(name):
+        return pkg_resources.get_distribution(name).version
+
+__version__ = _distribution_version("fenics-ffc")
 
 
 logging.basicConfig()
@@ -35,9 +42,27 @@ from ffc.main import main  # noqa: F401
 # Import default parameters
 from ffc.parameters import (default_jit_parameters, default_parameters)  # noqa: F401
 
-# Duplicate list of supported elements from FIAT and emove elements from
-# list that we don't support or don't trust
-supported_elements = sorted(supported_elements.keys())
-supported_elements.remove("Argyris")
-supported_elements.remove("Hermite")
-supported_elements.remove("Morley")
+
+def _supported_elements():
+    # Duplicate list of supported elements from FIAT and remove elements
+    # from list that we don't support or don't trust
+    from FIAT import supported_elements
+    elements = sorted(supported_elements.keys())
+    elements.remove("Argyris")
+    elements.remove("Hermite")
+    elements.remove("Morley")
+    return elements
+
+
+def __getattr__(name):
+    # FIAT is imported when the list of supported elements is first used
+    global supported_elements
+    if name == "supported_elements":
+        supported_elements = _supported_elements()
+        return supported_elements
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ is not supported
+    supported_elements = _supported_elements()
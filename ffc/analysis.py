@@ -15,15 +15,21 @@ form representation type.
 import logging
 import os
 import warnings
+import weakref
 from collections import namedtuple
 from typing import Dict, List, Tuple, Union
 
 import numpy
 
 import ufl
+from ffc.parameters import compute_jit_signature
 
 logger = logging.getLogger(__name__)
 
+# Form data by form signature and parameters, shared by all analyses of
+# a form in this process while some caller still holds the form data
+_form_data_cache = weakref.WeakValueDictionary()
+
 
 def analyze_ufl_objects(ufl_objects: Union[List[ufl.form.Form], List[ufl.FiniteElement], List],
                         parameters: Dict) -> Tuple[Tuple[ufl.algorithms.formdata.FormData], List, Dict, List]:
@@ -55,7 +61,7 @@ def analyze_ufl_objects(ufl_objects: Union[List[ufl.form.Form], List[ufl.FiniteE
         forms = ufl_objects
 
         # Analyze forms
-        form_datas = tuple(_analyze_form(form, parameters) for form in forms)
+        form_datas = tuple(_analyze_form_cached(form, parameters) for form in forms)
 
         # Extract unique elements across all forms
         for form_data in form_datas:
@@ -94,6 +100,33 @@ def analyze_ufl_objects(ufl_objects: Union[List[ufl.form.Form], List[ufl.FiniteE
                             unique_coordinate_elements=unique_coordinate_elements)
 
 
+def _analyze_form_cached(form: ufl.form.Form, parameters: Dict) -> ufl.algorithms.formdata.FormData:
+    """Analyzes form, reusing the form data of a previous analysis of
+    the same form with the same parameters if it is still alive
+
+    Note
+    ----
+    Form data refers to the coefficients of the analyzed form, so it is
+    only reused for the same form object, not for equal forms.
+
+    """
+    key = (form.signature(), compute_jit_signature(parameters), os.environ.get("FFC_FORCE_REPRESENTATION"))
+    form_data = _form_data_cache.get(key)
+    if form_data is not None and form_data.original_form is form:
+        logger.debug("Reusing form data from analysis cache")
+        return form_data
+
+    form_data = _analyze_form(form, parameters)
+
+    # Analyze the action of bilinear forms on a coefficient in the
+    # trial space, from which tabulate_action is generated
+    if parameters.get("tabulate_action") and len(form.arguments()) == 2:
+        form_data.action_form_data = _analyze_form(ufl.action(form), parameters)
+
+    _form_data_cache[key] = form_data
+    return form_data
+
+
 def _analyze_form(form: ufl.form.Form, parameters: Dict) -> ufl.algorithms.formdata.FormData:
     """Analyzes form and attaches metadata
 
@@ -7,7 +7,6 @@
 """Some basics for generating C code."""
 
 import ffc
-import ufl
 import hashlib
 
 
@@ -33,6 +32,7 @@ def compute_signature(ufl_objects, tag, parameters, coordinate_mapping=False):
     as a coordinate mapping element. There is no way to find this information
     just by looking at type of `ufl_object` passed.
     """
+    import ufl
 
     object_signature = ""
     for ufl_object in ufl_objects:
@@ -70,3 +70,24 @@ def compute_signature(ufl_objects, tag, parameters, coordinate_mapping=False):
     sig = hashlib.sha1(string.encode('utf-8')).hexdigest()
 
     return sig
+
+
+def make_finite_element_jit_classname(ufl_element, tag, parameters):
+    import ufl
+    assert isinstance(ufl_element, ufl.FiniteElementBase)
+    sig = compute_signature([ufl_element], tag, parameters)
+    return make_name("ffc_element_{}".format(sig), "finite_element", "main")
+
+
+def make_dofmap_jit_classname(ufl_element, tag, parameters):
+    import ufl
+    assert isinstance(ufl_element, ufl.FiniteElementBase)
+    sig = compute_signature([ufl_element], tag, parameters)
+    return make_name("ffc_element_{}".format(sig), "dofmap", "main")
+
+
+def make_coordinate_mapping_jit_classname(ufl_element, tag, parameters):
+    import ufl
+    assert isinstance(ufl_element, ufl.FiniteElementBase)
+    sig = compute_signature([ufl_element], tag, parameters, coordinate_mapping=True)
+    return make_name("ffc_coordinate_mapping_{}".format(sig), "coordinate_mapping", "main")
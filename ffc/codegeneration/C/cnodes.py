@@ -940,6 +940,23 @@ def flattened_indices(indices, shape):
         return result
 
 
+def collect_symbols(node):
+    """Return the set of names of all symbols in a CNode expression
+    or statement tree."""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Symbol):
+            names.add(node.name)
+        elif isinstance(node, (list, tuple)):
+            stack.extend(node)
+        elif isinstance(node, (CNode, FlattenedArray)):
+            for cls in type(node).__mro__:
+                stack.extend(getattr(node, slot, None) for slot in getattr(cls, "__slots__", ()))
+    return names
+
+
 # Base class for all statements
 
 
@@ -1487,14 +1504,20 @@ class ForRange(CStatement):
     __slots__ = ("index", "begin", "end", "body", "pragma", "index_type")
     is_scoped = True
 
-    def __init__(self, index, begin, end, body, index_type="int", vectorize=None):
+    def __init__(self, index, begin, end, body, index_type="int", vectorize=None,
+                 aligned=(), alignas=0):
         self.index = as_cexpr_or_string_symbol(index)
         self.begin = as_cexpr(begin)
         self.end = as_cexpr(end)
         self.body = as_cstatement(body)
 
         if vectorize:
-            pragma = Pragma("omp simd")
+            pragma = "omp simd"
+            # Promise the compiler arrays declared with alignas
+            if aligned and alignas:
+                names = ", ".join(as_symbol(a).name for a in aligned)
+                pragma += " aligned({}: {})".format(names, alignas)
+            pragma = Pragma(pragma)
         else:
             pragma = None
         self.pragma = pragma
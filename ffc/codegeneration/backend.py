@@ -16,7 +16,7 @@ from ffc.codegeneration.definitions import FFCBackendDefinitions
 class FFCBackend(object):
     """Class collecting all aspects of the FFC backend."""
 
-    def __init__(self, ir, parameters):
+    def __init__(self, ir, parameters, batch=False):
 
         # This is the seam where cnodes/C is chosen for the ffc backend
         self.language = ffc.codegeneration.C.cnodes
@@ -26,7 +26,7 @@ class FFCBackend(object):
         coefficient_numbering = ir["coefficient_numbering"]
         coefficient_offsets = ir["coefficient_offsets"]
         self.symbols = FFCBackendSymbols(self.language, coefficient_numbering,
-                                         coefficient_offsets)
+                                         coefficient_offsets, batch=batch)
         self.definitions = FFCBackendDefinitions(ir, self.language,
                                                  self.symbols, parameters)
         self.access = FFCBackendAccess(ir, self.language, self.symbols,
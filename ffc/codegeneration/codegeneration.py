@@ -23,6 +23,8 @@ from ffc.codegeneration.finite_element import \
     generator as ufc_finite_element_generator
 from ffc.codegeneration.form import ufc_form_generator
 from ffc.codegeneration.integrals import ufc_integral_generator
+from ffc.ir.ircache import store_integral
+from ffc.parallel import ordered_map
 
 logger = logging.getLogger(__name__)
 
@@ -37,25 +39,37 @@ def generate_code(analysis, object_names, ir, parameters, jit):
     # set_float_formatting(parameters["precision"])
     # set_exception_handling(parameters["convert_exceptions_to_warnings"])
 
-    # Generate code for finite_elements
-    logger.debug("Generating code for {} finite_element(s)".format(len(ir.elements)))
-    code_finite_elements = [
-        ufc_finite_element_generator(ir, parameters) for ir in ir.elements
-    ]
-
-    # Generate code for dofmaps
-    logger.debug("Generating code for {} dofmap(s)".format(len(ir.dofmaps)))
-    code_dofmaps = [ufc_dofmap_generator(ir, parameters) for ir in ir.dofmaps]
-
-    # Generate code for coordinate_mappings
-    logger.debug("Generating code for {} coordinate_mapping(s)".format(len(ir.coordinate_mappings)))
-    code_coordinate_mappings = [
-        ufc_coordinate_mapping_generator(ir, parameters) for ir in ir.coordinate_mappings
-    ]
-
-    # Generate code for integrals
-    logger.debug("Generating code for integrals")
-    code_integrals = [ufc_integral_generator(ir, parameters) for ir in ir.integrals]
+    # The finite_element, dofmap, coordinate_mapping and integral
+    # generators are independent, so run them as one set of tasks,
+    # possibly in parallel, and split the results afterwards
+    logger.debug("Generating code for {} finite_element(s), {} dofmap(s), {} coordinate_mapping(s) "
+                 "and {} integral(s)".format(len(ir.elements), len(ir.dofmaps),
+                                             len(ir.coordinate_mappings), len(ir.integrals)))
+    # Integrals reused in incremental mode already have their code
+    new_integrals = [obj_ir for obj_ir in ir.integrals if "cached_code" not in obj_ir]
+    generators = [(ufc_finite_element_generator, ir.elements),
+                  (ufc_dofmap_generator, ir.dofmaps),
+                  (ufc_coordinate_mapping_generator, ir.coordinate_mappings),
+                  (ufc_integral_generator, new_integrals)]
+    tasks = [(generator, obj_ir, parameters) for generator, irs in generators for obj_ir in irs]
+    code = ordered_map(_generate, tasks, parameters.get("codegen_workers", 1))
+
+    split_code = []
+    for generator, irs in generators:
+        split_code.append(code[:len(irs)])
+        code = code[len(irs):]
+    code_finite_elements, code_dofmaps, code_coordinate_mappings, code_new_integrals = split_code
+
+    # Store the code of new integrals for later incremental compilations
+    code_new_integrals = iter(code_new_integrals)
+    code_integrals = []
+    for obj_ir in ir.integrals:
+        if "cached_code" in obj_ir:
+            code_integrals.append(obj_ir["cached_code"])
+        else:
+            code_integrals.append(next(code_new_integrals))
+            if "incremental_signature" in obj_ir:
+                store_integral(obj_ir, code_integrals[-1], parameters)
 
     # Generate code for forms
     logger.debug("Generating code for forms")
@@ -78,6 +92,10 @@ def generate_code(analysis, object_names, ir, parameters, jit):
                        forms=code_forms, includes=includes)
 
 
+def _generate(generator, ir, parameters):
+    return generator(ir, parameters)
+
+
 def _extract_includes(full_ir, code_integrals, jit):
     # ir_finite_elements, ir_dofmaps, ir_coordinate_mappings, ir_integrals, ir_forms = full_ir
 
@@ -31,10 +31,23 @@ def ufc_integral_generator(ir, parameters):
     # TODO: Drop prefix argument and get from ir:
     code = generate_integral_code(ir, ir["prefix"], parameters)
 
+    # Generate code for the action of a bilinear integral
+    if "action" in ir:
+        action_code = generate_integral_code(ir["action"], ir["prefix"],
+                                             dict(parameters, tabulate_tensor_batch=False,
+                                                  tabulate_diagonal=False))
+        code["tabulate_action"] = action_code["tabulate_tensor"]
+
     # Hack for benchmarking overhead in assembler with empty
     # tabulate_tensor
     if parameters["generate_dummy_tabulate_tensor"]:
         code["tabulate_tensor"] = ""
+        if "tabulate_tensor_batch" in code:
+            code["tabulate_tensor_batch"] = ""
+        if "tabulate_action" in code:
+            code["tabulate_action"] = ""
+        if "tabulate_diagonal" in code:
+            code["tabulate_diagonal"] = ""
 
     # Format tabulate tensor body
     tabulate_tensor_declaration = ufc_integrals.tabulate_implementation[
@@ -42,11 +55,29 @@ def ufc_integral_generator(ir, parameters):
     tabulate_tensor_fn = tabulate_tensor_declaration.format(
         factory_name=factory_name, tabulate_tensor=code["tabulate_tensor"])
 
+    # Format the optional kernels of the integral, each left NULL in
+    # the integral when not generated
+    optional_kernels = [("tabulate_tensor_batch", ufc_integrals.tabulate_batch_implementation),
+                        ("tabulate_action", ufc_integrals.tabulate_action_implementation),
+                        ("tabulate_diagonal", ufc_integrals.tabulate_diagonal_implementation)]
+    extra_assignments = ""
+    for name, implementations in optional_kernels:
+        if integral_type not in implementations:
+            continue
+        if name in code:
+            tabulate_tensor_fn += implementations[integral_type].format(
+                factory_name=factory_name, tabulate_tensor=code[name])
+            fn = "{}_{}".format(name, factory_name)
+        else:
+            fn = "NULL"
+        extra_assignments += "\n  integral->{} = {};".format(name, fn)
+
     # Format implementation code
     implementation = ufc_integrals.factory.format(
         type=integral_type,
         factory_name=factory_name,
         enabled_coefficients=code["enabled_coefficients"],
-        tabulate_tensor=tabulate_tensor_fn)
+        tabulate_tensor=tabulate_tensor_fn,
+        extra_assignments=extra_assignments)
 
     return declaration, implementation
@@ -62,6 +62,68 @@ void tabulate_tensor_{factory_name}(ufc_scalar_t* restrict A, const ufc_scalar_t
 """
 }
 
+tabulate_batch_implementation = {
+    "cell":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                          const double* restrict coordinate_dofs,
+                                          int num_cells,
+                                          const int* restrict cell_orientation)
+{{
+{tabulate_tensor}
+}}
+""",
+    "exterior_facet":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                          const double* restrict coordinate_dofs,
+                                          int num_cells, const int* restrict facet,
+                                          const int* restrict cell_orientation)
+{{
+{tabulate_tensor}
+}}
+""",
+    "interior_facet":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                          const double* restrict coordinate_dofs_0,
+                                          const double* restrict coordinate_dofs_1,
+                                          int num_cells, const int* restrict facet_0,
+                                          const int* restrict facet_1,
+                                          const int* restrict cell_orientation_0,
+                                          const int* restrict cell_orientation_1)
+{{
+{tabulate_tensor}
+}}
+""",
+    "vertex":
+    """
+void tabulate_tensor_batch_{factory_name}(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                          const double* restrict coordinate_dofs,
+                                          int num_cells, const int* restrict vertex,
+                                          const int* restrict cell_orientation)
+{{
+{tabulate_tensor}
+}}
+"""
+}
+
+# The action of a bilinear integral has the signature of tabulate_tensor
+tabulate_action_implementation = {
+    integral_type: implementation.replace("tabulate_tensor_{factory_name}",
+                                          "tabulate_action_{factory_name}")
+    for integral_type, implementation in tabulate_implementation.items()
+    if integral_type != "custom"
+}
+
+# The diagonal of a bilinear integral has the signature of tabulate_tensor
+tabulate_diagonal_implementation = {
+    integral_type: implementation.replace("tabulate_tensor_{factory_name}",
+                                          "tabulate_diagonal_{factory_name}")
+    for integral_type, implementation in tabulate_implementation.items()
+    if integral_type != "custom"
+}
+
 factory = """
 // Code for {type}_integral {factory_name}
 
@@ -73,7 +135,7 @@ ufc_{type}_integral* create_{factory_name}(void)
 
   ufc_{type}_integral* integral = malloc(sizeof(*integral));
   integral->enabled_coefficients = enabled;
-  integral->tabulate_tensor = tabulate_tensor_{factory_name};
+  integral->tabulate_tensor = tabulate_tensor_{factory_name};{extra_assignments}
   return integral;
 }};
 
@@ -5,20 +5,42 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import concurrent.futures
+import hashlib
 import importlib
+import importlib.machinery
 import sys
 import os
 import logging
 import time
-import cffi
 import pathlib
+import re
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-import ufl
 import ffc
-from ffc.analysis import analyze_ufl_objects
+import ffc.classname
+import ffc.parameters
+from ffc.codegeneration import jitcache
 
 logger = logging.getLogger(__name__)
 
+# File descriptors of build locks held by this process, by module name
+_build_locks = {}
+
+# Start time of builds done by this process, by module name
+_build_started = {}
+
+# JIT signatures in generated names, e.g. ffc_element_<sig>_dofmap_main
+_signature_pattern = re.compile(r"(?<![0-9a-f])[0-9a-f]{40}(?![0-9a-f])")
+
+# Modules which other modules link to, using the names of their objects
+_linked_module_prefixes = ("libffc_elements_", "libffc_cmaps_")
+
 UFC_HEADER_DECL = """
 typedef {} ufc_scalar_t;  /* Hack to deal with scalar type */
 
@@ -142,6 +164,15 @@ const bool* enabled_coefficients;
 void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                         const double* restrict coordinate_dofs,
                         int cell_orientation);
+void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                              const double* restrict coordinate_dofs,
+                              int num_cells, const int* restrict cell_orientation);
+void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs,
+                        int cell_orientation);
+void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs,
+                        int cell_orientation);
 } ufc_cell_integral;
 
 typedef struct ufc_exterior_facet_integral
@@ -150,6 +181,16 @@ const bool* enabled_coefficients;
 void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                         const double* restrict coordinate_dofs, int facet,
                         int cell_orientation);
+void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                              const double* restrict coordinate_dofs,
+                              int num_cells, const int* restrict facet,
+                              const int* restrict cell_orientation);
+void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs, int facet,
+                        int cell_orientation);
+void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs, int facet,
+                        int cell_orientation);
 } ufc_exterior_facet_integral;
 
 typedef struct ufc_interior_facet_integral
@@ -160,6 +201,23 @@ void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                         const double* restrict coordinate_dofs_1,
                         int facet_0, int facet_1, int cell_orientation_0,
                         int cell_orientation_1);
+void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                              const double* restrict coordinate_dofs_0,
+                              const double* restrict coordinate_dofs_1,
+                              int num_cells, const int* restrict facet_0,
+                              const int* restrict facet_1,
+                              const int* restrict cell_orientation_0,
+                              const int* restrict cell_orientation_1);
+void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs_0,
+                        const double* restrict coordinate_dofs_1,
+                        int facet_0, int facet_1, int cell_orientation_0,
+                        int cell_orientation_1);
+void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs_0,
+                        const double* restrict coordinate_dofs_1,
+                        int facet_0, int facet_1, int cell_orientation_0,
+                        int cell_orientation_1);
 } ufc_interior_facet_integral;
 
 typedef struct ufc_vertex_integral
@@ -168,6 +226,16 @@ const bool* enabled_coefficients;
 void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                         const double* restrict coordinate_dofs, int vertex,
                         int cell_orientation);
+void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                              const double* restrict coordinate_dofs,
+                              int num_cells, const int* restrict vertex,
+                              const int* restrict cell_orientation);
+void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs, int vertex,
+                        int cell_orientation);
+void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                        const double* restrict coordinate_dofs, int vertex,
+                        int cell_orientation);
 } ufc_vertex_integral;
 
 typedef struct ufc_custom_integral
@@ -218,9 +286,22 @@ ufc_custom_integral* (*create_custom_integral)(int subdomain_id);
 """
 
 
-def get_ufl_dependencies(ufl_objects, parameters):
+def analyze_ufl_objects(ufl_objects, parameters):
+    """Analyze UFL objects, see ffc.analysis.analyze_ufl_objects.
+
+    The analysis pulls in NumPy and the UFL algorithms, so it is only
+    imported when a module has to be built.
+    """
+    from ffc.analysis import analyze_ufl_objects
+    return analyze_ufl_objects(ufl_objects, parameters)
+
 
-    _, unique_elements, _, unique_coordinate_elements = analyze_ufl_objects(ufl_objects, parameters)
+def get_ufl_dependencies(ufl_objects, parameters, analysis=None):
+    import ufl
+
+    if analysis is None:
+        analysis = analyze_ufl_objects(ufl_objects, parameters)
+    _, unique_elements, _, unique_coordinate_elements = analysis
 
     mesh_id = None
     if isinstance(ufl_objects[0], ufl.Form):
@@ -240,58 +321,172 @@ def get_ufl_dependencies(ufl_objects, parameters):
 
     logger.info('Dependencies = ' + str(unique_elements) + str(unique_meshes))
 
-    depfiles = []
-    for el in unique_elements:
-        objects, module = compile_elements([el], parameters=parameters)
-        libname = pathlib.Path(module.__file__).stem
-        depfiles.append(libname[3:])
-
-    for cm in unique_meshes:
-        objects, module = compile_coordinate_maps([cm], parameters=parameters)
-        libname = pathlib.Path(module.__file__).stem
-        depfiles.append(libname[3:])
+    dependencies = [(compile_elements, el) for el in unique_elements]
+    dependencies += [(compile_coordinate_maps, cm) for cm in unique_meshes]
+
+    # Dependencies are independent of each other, so build them
+    # concurrently when allowed; the pool is drained before returning
+    workers = min(parameters.get("jit_workers", 1), len(dependencies))
+    if workers > 1:
+        # Nested dependencies are built serially inside pool workers
+        worker_parameters = dict(parameters, jit_workers=1)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_compile_dependency, compile_object, ufl_object, worker_parameters)
+                       for compile_object, ufl_object in dependencies]
+            depfiles = [future.result() for future in futures]
+    else:
+        depfiles = [_compile_dependency(compile_object, ufl_object, parameters)
+                    for compile_object, ufl_object in dependencies]
 
     return depfiles
 
 
+def _compile_dependency(compile_object, ufl_object, parameters):
+    """Compile a single dependency and return its library name for linking"""
+    objects, module = compile_object([ufl_object], parameters=parameters)
+    libname = pathlib.Path(module.__file__).stem
+    return libname[3:]
+
+
+def _load_objects(cache_dir, module_name, object_names):
+    """Import compiled module from cache_dir and create the named objects"""
+    sys.path.insert(0, str(cache_dir))
+    try:
+        compiled_module = importlib.import_module(module_name)
+    finally:
+        sys.path.remove(str(cache_dir))
+    compiled_objects = [getattr(compiled_module.lib, "create_" + name)() for name in object_names]
+
+    return compiled_objects, compiled_module
+
+
+def lookup_cached_module(module_name, object_names, parameters):
+    """Return compiled objects and module if already built in the cache,
+    otherwise (None, None).
+
+    This never creates files and never waits for other processes, so it
+    can be called before any UFL analysis is done.
+    """
+    cache_dir = pathlib.Path(parameters.get("cache_dir", "compile_cache")).expanduser()
+    entry = jitcache.find(cache_dir, module_name)
+    if entry is None:
+        return None, None
+
+    logger.info("Found compiled module in cache: " + entry.path)
+    jitcache.record_hit(cache_dir, module_name)
+    try:
+        return _load_objects(cache_dir, entry.module, entry.symbols)
+    except ImportError:
+        # Evicted since the lookup, rebuild
+        logger.warning("Failed to load cached module " + module_name)
+        return None, None
+
+
 def get_cached_module(module_name, object_names, parameters):
+    """Return compiled objects and module from the cache, or (None, None)
+    if this process should build the module.
+
+    Concurrent processes are serialised on an advisory lock per module.
+    Waiters block on the lock and wake as soon as the builder releases it
+    in _compile_objects. The kernel releases the lock of a process that
+    dies, so a crashed build is simply redone by the next process.
+    """
     cache_dir = pathlib.Path(parameters.get("cache_dir",
                                             "compile_cache"))
     cache_dir = cache_dir.expanduser()
 
-    timeout = int(parameters.get("timeout", 10))
-
-    c_filename = cache_dir.joinpath(module_name + ".c")
-    ready_name = c_filename.with_suffix(".c.cached")
-
     # Ensure cache dir exists
     os.makedirs(cache_dir, exist_ok=True)
 
-    # Ensure it is first on the path for loading modules
-    sys.path.insert(0, str(cache_dir))
+    if fcntl is None:
+        return _get_cached_module_polling(module_name, object_names, parameters)
+
+    lock_name = str(cache_dir.joinpath(module_name + ".lock"))
+    while True:
+        lock_fd = os.open(lock_name, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Waiting for another process to build " + module_name)
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+            # The lock file may have been removed by cache eviction while
+            # waiting, in which case the lock is on a stale file
+            try:
+                if os.stat(lock_name).st_ino == os.fstat(lock_fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            _release_lock(lock_fd)
+        except BaseException:
+            os.close(lock_fd)
+            raise
+
+    entry = jitcache.find(cache_dir, module_name)
+    if entry is not None:
+        try:
+            compiled = _load_objects(cache_dir, entry.module, entry.symbols)
+        except ImportError:
+            # E.g. an alias of a module evicted in the meantime
+            logger.warning("Dropping cache entry of unloadable module " + module_name)
+            jitcache.unpublish(cache_dir, module_name)
+        else:
+            _release_lock(lock_fd)
+            jitcache.record_hit(cache_dir, module_name)
+            return compiled
+
+    if os.path.exists(_build_dir(cache_dir, module_name)):
+        logger.warning("Reclaiming stale JIT build of " + module_name)
+
+    # Keep the lock until the module has been published
+    _build_locks[module_name] = lock_fd
+    _build_started[module_name] = time.time()
+    return None, None
+
+
+def _build_dir(cache_dir, module_name):
+    return cache_dir.joinpath(jitcache.BUILD_DIR_PREFIX + module_name)
+
+
+def _release_lock(lock_fd):
+    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    os.close(lock_fd)
+
+
+def _release_build_lock(module_name):
+    _build_started.pop(module_name, None)
+    lock_fd = _build_locks.pop(module_name, None)
+    if lock_fd is not None:
+        _release_lock(lock_fd)
+
+
+def _get_cached_module_polling(module_name, object_names, parameters):
+    """Fallback for platforms without fcntl, using the C file as lock"""
+    cache_dir = pathlib.Path(parameters.get("cache_dir",
+                                            "compile_cache"))
+    cache_dir = cache_dir.expanduser()
+
+    timeout = int(parameters.get("timeout", 10))
+
+    c_filename = cache_dir.joinpath(module_name + ".c")
 
     try:
         # Create C file with exclusive access
         open(c_filename, "x")
+        _build_started[module_name] = time.time()
         return None, None
 
     except FileExistsError:
         logger.info("Cached C file already exists: " + str(c_filename))
         # Now wait for ready
         for i in range(timeout):
-            if os.path.exists(ready_name):
-                # Build list of compiled objects
-                compiled_module = \
-                    importlib.import_module(module_name)
-                sys.path.remove(str(cache_dir))
-                compiled_objects = \
-                    [getattr(compiled_module.lib,
-                             "create_" + name)()
-                     for name in object_names]
-
-                return compiled_objects, compiled_module
-
-            logger.info("Waiting for " + str(ready_name) + " to appear.")
+            entry = jitcache.find(cache_dir, module_name)
+            if entry is not None:
+                jitcache.record_hit(cache_dir, module_name)
+                return _load_objects(cache_dir, entry.module, entry.symbols)
+
+            logger.info("Waiting for " + module_name + " to appear in the cache index.")
             time.sleep(1)
         raise TimeoutError("""JIT compilation did not complete on another process.
         Try cleaning cache (e.g. remove {}) or increase timeout parameter.""".format(c_filename))
@@ -301,22 +496,29 @@ def compile_elements(elements, module_name=None, parameters=None):
     """Compile a list of UFL elements and dofmaps into UFC Python objects"""
     p = ffc.parameters.validate_parameters(parameters)
 
-    depfiles = []
-    if p['crosslink']:
-        depfiles = get_ufl_dependencies(elements, p)
-
-    logger.info('Compiling elements: ' + str(elements))
-
     # Get a signature for these elements
     module_name = 'libffc_elements_' + ffc.classname.compute_signature(elements, '', p)
 
     names = []
     for e in elements:
-        name = ffc.ir.representation.make_finite_element_jit_classname(e, "JIT", p)
+        name = ffc.classname.make_finite_element_jit_classname(e, "JIT", p)
         names.append(name)
-        name = ffc.ir.representation.make_dofmap_jit_classname(e, "JIT", p)
+        name = ffc.classname.make_dofmap_jit_classname(e, "JIT", p)
         names.append(name)
 
+    # Fast path: module already built, skip analysis of dependencies
+    obj, mod = lookup_cached_module(module_name, names, p)
+    if obj is not None:
+        # Pair up elements with dofmaps
+        obj = list(zip(obj[::2], obj[1::2]))
+        return obj, mod
+
+    depfiles = []
+    if p['crosslink']:
+        depfiles = get_ufl_dependencies(elements, p)
+
+    logger.info('Compiling elements: ' + str(elements))
+
     obj, mod = get_cached_module(module_name, names, p)
     if obj is not None:
         # Pair up elements with dofmaps
@@ -342,18 +544,26 @@ def compile_forms(forms, module_name=None, parameters=None):
     """Compile a list of UFL forms into UFC Python objects"""
     p = ffc.parameters.validate_parameters(parameters)
 
-    depfiles = []
-    if p['crosslink']:
-        depfiles = get_ufl_dependencies(forms, p)
-
-    logger.info('Compiling forms: ' + str(forms))
-
     # Get a signature for these forms
     module_name = 'libffc_forms_' + ffc.classname.compute_signature(forms, '', p)
 
     form_names = [ffc.classname.make_name("JIT", "form", i)
                   for i in range(len(forms))]
 
+    # Fast path: module already built, skip analysis of dependencies
+    obj, mod = lookup_cached_module(module_name, form_names, p)
+    if obj is not None:
+        return obj, mod
+
+    depfiles = []
+    if p['crosslink']:
+        # Holding the analysis keeps the form data in the analysis
+        # cache, so compiling the forms below does not analyze them again
+        analysis = analyze_ufl_objects(forms, p)
+        depfiles = get_ufl_dependencies(forms, p, analysis)
+
+    logger.info('Compiling forms: ' + str(forms))
+
     obj, mod = get_cached_module(module_name, form_names, p)
     if obj is not None:
         return obj, mod
@@ -374,18 +584,23 @@ def compile_coordinate_maps(meshes, module_name=None, parameters=None):
     """Compile a list of UFL coordinate mappings into UFC Python objects"""
     p = ffc.parameters.validate_parameters(parameters)
 
+    # Get a signature for these cmaps
+    module_name = 'libffc_cmaps_' + ffc.classname.compute_signature(meshes, '', p, True)
+
+    cmap_names = [ffc.classname.make_coordinate_mapping_jit_classname(
+        mesh.ufl_coordinate_element(), "JIT", p) for mesh in meshes]
+
+    # Fast path: module already built, skip analysis of dependencies
+    obj, mod = lookup_cached_module(module_name, cmap_names, p)
+    if obj is not None:
+        return obj, mod
+
     depfiles = []
     if (p['crosslink']):
         depfiles = get_ufl_dependencies(meshes, p)
 
     logger.info('Compiling cmaps: ' + str(meshes))
 
-    # Get a signature for these cmaps
-    module_name = 'libffc_cmaps_' + ffc.classname.compute_signature(meshes, '', p, True)
-
-    cmap_names = [ffc.ir.representation.make_coordinate_mapping_jit_classname(
-        mesh.ufl_coordinate_element(), "JIT", p) for mesh in meshes]
-
     obj, mod = get_cached_module(module_name, cmap_names, p)
     if obj is not None:
         return obj, mod
@@ -400,48 +615,253 @@ def compile_coordinate_maps(meshes, module_name=None, parameters=None):
     return _compile_objects(decl, meshes, cmap_names, module_name, p, depfiles)
 
 
+def compile_batch(ufl_objects, parameters=None):
+    """Compile a mixed list of UFL forms, elements and meshes into a
+    single shared library and return UFC Python objects in input order.
+
+    Elements are returned as (element, dofmap) pairs. All elements and
+    coordinate mappings the forms depend on are built into the same
+    library, so the whole batch costs one compile and link.
+    """
+    import ufl
+    p = ffc.parameters.validate_parameters(parameters)
+
+    forms, elements, meshes = [], [], []
+    names = []
+    for obj in ufl_objects:
+        if isinstance(obj, ufl.Form):
+            names.append([ffc.classname.make_name("JIT", "form", len(forms))])
+            forms.append(obj)
+        elif isinstance(obj, ufl.FiniteElementBase):
+            names.append([ffc.classname.make_finite_element_jit_classname(obj, "JIT", p),
+                          ffc.classname.make_dofmap_jit_classname(obj, "JIT", p)])
+            elements.append(obj)
+        elif isinstance(obj, ufl.Mesh):
+            names.append([ffc.classname.make_coordinate_mapping_jit_classname(
+                obj.ufl_coordinate_element(), "JIT", p)])
+            meshes.append(obj)
+        else:
+            raise TypeError("UFL objects not recognised.")
+
+    # Get a signature for the batch from the signatures of its objects, in order
+    signature = ";".join(ffc.classname.compute_signature([obj], '', p) for obj in ufl_objects)
+    module_name = 'libffc_batch_' + hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    object_names = [name for obj_names in names for name in obj_names]
+
+    # Fast path: module already built, skip analysis
+    obj, mod = lookup_cached_module(module_name, object_names, p)
+    if obj is not None:
+        return _group_batch_objects(obj, names), mod
+
+    logger.info('Compiling batch: ' + str(ufl_objects))
+
+    obj, mod = get_cached_module(module_name, object_names, p)
+    if obj is not None:
+        return _group_batch_objects(obj, names), mod
+
+    scalar_type = p["scalar_type"].replace("complex", "_Complex")
+    decl = UFC_HEADER_DECL.format(scalar_type)
+    if forms or elements:
+        decl += UFC_ELEMENT_DECL + UFC_DOFMAP_DECL
+    if forms or meshes:
+        decl += UFC_COORDINATEMAPPING_DECL
+    if forms:
+        decl += UFC_INTEGRAL_DECL + UFC_FORM_DECL
+
+    templates = {ufl.Form: ["ufc_form * create_{name}(void);\n"],
+                 ufl.FiniteElementBase: ["ufc_finite_element * create_{name}(void);\n",
+                                         "ufc_dofmap * create_{name}(void);\n"],
+                 ufl.Mesh: ["ufc_coordinate_mapping * create_{name}(void);\n"]}
+    for obj, obj_names in zip(ufl_objects, names):
+        obj_templates = next(t for cls, t in templates.items() if isinstance(obj, cls))
+        for template, name in zip(obj_templates, obj_names):
+            decl += template.format(name=name)
+
+    try:
+        code_body = _generate_batch_code(forms, elements, meshes, p)
+    except BaseException:
+        _release_build_lock(module_name)
+        raise
+
+    objects, module = _build_module(decl, code_body, object_names, module_name, p)
+    return _group_batch_objects(objects, names), module
+
+
+def _generate_batch_code(forms, elements, meshes, parameters):
+    """Generate code for a batch and everything it depends on"""
+    import ufl
+    import ffc.compiler
+
+    # Collect the elements and coordinate elements needed by the batch
+    unique_elements = set(ufl.algorithms.analysis.extract_sub_elements(elements))
+    coordinate_elements = [mesh.ufl_coordinate_element() for mesh in meshes]
+    if forms:
+        # The analysis is held until the forms are compiled below, so
+        # that the form data is reused from the analysis cache
+        analysis = analyze_ufl_objects(forms, parameters)
+        unique_elements.update(analysis.unique_elements)
+        coordinate_elements += analysis.unique_coordinate_elements
+    unique_elements.update(ufl.algorithms.analysis.extract_sub_elements(coordinate_elements))
+    coordinate_elements = sorted(set(coordinate_elements), key=lambda x: repr(x))
+
+    # Generate each kind separately, as in jit mode, so that every class
+    # is defined exactly once. Coordinate mappings can only be jit
+    # compiled one at a time.
+    groups = [ufl.algorithms.sort_elements(unique_elements)]
+    groups += [[ufl.Mesh(element)] for element in coordinate_elements]
+    groups += [forms]
+
+    code_bodies = []
+    for group in groups:
+        if group:
+            _, code_body = ffc.compiler.compile_ufl_objects(group, prefix="JIT", parameters=parameters, jit=True)
+            code_bodies.append(code_body)
+
+    return "\n".join(code_bodies)
+
+
+def _group_batch_objects(objects, names):
+    """Split the flat list of compiled objects to match the batch input"""
+    grouped = []
+    i = 0
+    for obj_names in names:
+        n = len(obj_names)
+        grouped.append(objects[i] if n == 1 else tuple(objects[i:i + n]))
+        i += n
+    return grouped
+
+
 def _compile_objects(decl, ufl_objects, object_names, module_name, parameters, link=[]):
+    # The compiler pulls in FIAT, NumPy and all compiler stages, so it is
+    # only imported when a module has to be built
+    import ffc.compiler
+
+    try:
+        _, code_body = ffc.compiler.compile_ufl_objects(ufl_objects, prefix="JIT", parameters=parameters,
+                                                        jit=parameters['crosslink'])
+    except BaseException:
+        # Wake up processes waiting for this module
+        _release_build_lock(module_name)
+        raise
+
+    return _build_module(decl, code_body, object_names, module_name, parameters, link)
+
+
+def _build_module(decl, code_body, object_names, module_name, parameters, link=[]):
 
     cache_dir = pathlib.Path(parameters.get("cache_dir",
                                             "compile_cache"))
     cache_dir = cache_dir.expanduser()
 
+    start_time = _build_started.get(module_name, time.time())
+    # Link names carry the extension suffix, e.g. ffc_elements_<sig>.cpython-36m-x86_64-linux-gnu
+    dependencies = ["lib" + libname.split(".")[0] for libname in link]
+
     # Cancel crosslinking on MacOS, not needed
     if sys.platform == 'darwin':
         link = []
 
-    _, code_body = ffc.compiler.compile_ufl_objects(ufl_objects, prefix="JIT", parameters=parameters,
-                                                    jit=parameters['crosslink'])
+    # Optimisation flags are part of the module signature, so each set
+    # of flags gets its own cache entry
+    if parameters["cpp_optimize"]:
+        compile_args = parameters["cpp_optimize_flags"].split()
+    else:
+        compile_args = ["-O0"]
 
-    ffibuilder = cffi.FFI()
-    ffibuilder.set_source(
-        module_name, code_body, include_dirs=[ffc.codegeneration.get_include_path()],
-        library_dirs=[str(cache_dir.absolute())],
-        runtime_library_dirs=[str(cache_dir.absolute())], libraries=link,
-        extra_compile_args=['-g0'])  # turn off -g
+    # Honour the omp simd pragmas of vectorized and batch kernels,
+    # without linking the OpenMP runtime
+    if parameters.get("vectorize") or parameters.get("tabulate_tensor_batch"):
+        compile_args.append("-fopenmp-simd")
 
-    ffibuilder.cdef(decl)
+    content = _content_signature(decl, code_body, object_names, compile_args, link)
 
-    c_filename = cache_dir.joinpath(module_name + ".c")
-    ready_name = c_filename.with_suffix(".c.cached")
+    try:
+        # Reuse a module built from the same code under another signature
+        compiled = _load_duplicate(cache_dir, module_name, object_names, content, start_time)
+
+        if compiled is None:
+            import cffi
+            ffibuilder = cffi.FFI()
+            ffibuilder.set_source(
+                module_name, code_body, include_dirs=[ffc.codegeneration.get_include_path()],
+                library_dirs=[str(cache_dir.absolute())],
+                runtime_library_dirs=[str(cache_dir.absolute())], libraries=link,
+                extra_compile_args=['-g0'] + compile_args)  # turn off -g
+
+            ffibuilder.cdef(decl)
+
+            # Compile in a private directory, which holds the build lock
+            # so nobody else uses it. A directory left by a crashed build
+            # is removed here.
+            build_dir = _build_dir(cache_dir, module_name)
+            shutil.rmtree(build_dir, ignore_errors=True)
+            os.makedirs(build_dir)
+            library_path = pathlib.Path(ffibuilder.compile(tmpdir=str(build_dir), verbose=False))
+
+            # Move into the cache with atomic renames, the library last
+            c_filename = cache_dir.joinpath(module_name + ".c")
+            os.replace(build_dir.joinpath(c_filename.name), c_filename)
+            os.replace(library_path, cache_dir.joinpath(library_path.name))
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+            # Publish in the cache index, after which the module is ready
+            jitcache.publish(cache_dir, module_name, cache_dir.joinpath(library_path.name), object_names,
+                             time.time() - start_time, dependencies, content)
+    finally:
+        # Wake up processes waiting for this module
+        _release_build_lock(module_name)
 
-    # Ensure path is set for module
-    sys.path.insert(0, str(cache_dir))
+    # Build list of compiled objects
+    if compiled is None:
+        compiled = _load_objects(cache_dir, module_name, object_names)
 
-    # Ensure cache dir exists
-    os.makedirs(cache_dir, exist_ok=True)
+    if parameters["cache_max_size"] > 0 or parameters["cache_max_entries"] > 0:
+        jitcache.prune(cache_dir, parameters["cache_max_size"], parameters["cache_max_entries"],
+                       keep=[module_name] + dependencies)
 
-    # Compile
-    ffibuilder.compile(tmpdir=cache_dir, verbose=False)
+    return compiled
 
-    # Create a "status ready" file
-    # If this fails, it is an error, because it should not exist yet.
-    fd = open(ready_name, "x")
-    fd.close()
 
-    # Build list of compiled objects
-    compiled_module = importlib.import_module(module_name)
-    sys.path.remove(str(cache_dir))
-    compiled_objects = [getattr(compiled_module.lib, "create_" + name)() for name in object_names]
+def _content_signature(decl, code_body, object_names, compile_args, link):
+    """Hash of everything that determines the compiled library. Comments
+    are left out, as the generated code starts with a comment listing
+    all parameters, most of which do not change the code.
 
-    return compiled_objects, compiled_module
+    The JIT signatures in generated names are replaced by their number
+    in order of appearance, so objects differing only in their names
+    have the same content. The object names come first, so that equal
+    content implies the objects are in the same order."""
+    numbering = {}
+
+    def normalize(text):
+        return _signature_pattern.sub(lambda m: "<{}>".format(numbering.setdefault(m.group(0), len(numbering))),
+                                      text)
+
+    code = "\n".join(line for line in code_body.splitlines() if not line.startswith("//"))
+    signatures = [normalize(" ".join(object_names)), normalize(decl), normalize(code), " ".join(compile_args),
+                  " ".join(link), importlib.machinery.EXTENSION_SUFFIXES[0], ffc.codegeneration.get_signature()]
+    return hashlib.sha1(";".join(signatures).encode('utf-8')).hexdigest()
+
+
+def _load_duplicate(cache_dir, module_name, object_names, content, start_time):
+    """Load and publish as alias a module with the same content, or return None.
+    The objects are created under the names they have in that module."""
+    target = jitcache.find_content(cache_dir, content)
+    if target is None:
+        return None
+
+    # Modules linking to this one need the objects under their own names
+    if module_name.startswith(_linked_module_prefixes) and target.symbols != list(object_names):
+        return None
+
+    try:
+        compiled = _load_objects(cache_dir, target.module, target.symbols)
+    except ImportError:
+        return None
+
+    if not jitcache.publish_alias(cache_dir, module_name, target, time.time() - start_time):
+        return None
+
+    logger.info("Module {} has the same code as {}, not compiling".format(module_name, target.module))
+    return compiled
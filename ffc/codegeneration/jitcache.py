@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Management of the JIT cache directory.
+
+Every JIT module is a group of files in the cache directory sharing the
+module name as prefix. Published modules are recorded in an sqlite
+index in the cache directory, which maps the module name (the JIT
+signature) to the module files, the symbols it provides, the libraries
+it links to, its build duration, size and last access. A module is
+ready for use once its index entry exists. The links between modules
+are also kept in a table of their own, to find the modules linking to
+a module being evicted. The index also holds the hit and miss counters
+of the cache.
+
+Entries also record a hash of the generated code and build flags, with
+the JIT signatures in generated names left out. When a new signature
+produces the same content as an existing module, it is published as an
+alias of that module instead of being compiled again. The .so of a
+cffi module cannot be renamed, so an alias loads the module it refers
+to and records its symbols.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "libffc-index.sqlite"
+
+# Modules are built in a directory named by this prefix and the module
+# name, and moved into the cache directory when complete
+BUILD_DIR_PREFIX = "libffc-build-"
+
+# Bump when the index schema changes, older indexes are then discarded
+INDEX_VERSION = 4
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", ["name", "module", "path", "files", "symbols", "dependencies", "content",
+                   "build_time", "size", "created", "last_access", "hits"])
+
+# Seconds to wait for other processes writing to the index
+_TIMEOUT = 60.0
+
+# Open index connections, by cache dir and process (connections must
+# not be shared with forked processes)
+_connections = {}
+
+
+def get_cache_dir(parameters):
+    return pathlib.Path(parameters.get("cache_dir", "compile_cache")).expanduser()
+
+
+def _connect(cache_dir):
+    cache_dir = pathlib.Path(cache_dir)
+    key = (str(cache_dir.absolute()), os.getpid())
+    if key in _connections:
+        return _connections[key]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(str(cache_dir.joinpath(INDEX_FILE)), timeout=_TIMEOUT)
+    # The write-ahead log lets lookups proceed while another process
+    # publishes a module, and avoids an fsync per recorded hit. It
+    # needs shared memory, so on network file systems (NFS) fall back
+    # to the rollback journal.
+    try:
+        journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    except sqlite3.OperationalError:
+        journal_mode = None
+    if journal_mode == "wal":
+        conn.execute("PRAGMA synchronous=NORMAL")
+    else:
+        logger.debug("Using rollback journal for JIT cache index in {}".format(cache_dir))
+        conn.execute("PRAGMA journal_mode=DELETE")
+    with conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            conn.execute("DROP TABLE IF EXISTS modules")
+            conn.execute("DROP TABLE IF EXISTS dependencies")
+            conn.execute("DROP TABLE IF EXISTS counters")
+            conn.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+        conn.execute("""CREATE TABLE IF NOT EXISTS modules (
+            name TEXT PRIMARY KEY, module TEXT, path TEXT, files TEXT, symbols TEXT,
+            dependencies TEXT, content TEXT, build_time REAL, size INTEGER, created REAL,
+            last_access REAL, hits INTEGER)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS modules_last_access ON modules (last_access)")
+        conn.execute("CREATE INDEX IF NOT EXISTS modules_content ON modules (content)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS dependencies (
+            name TEXT, dependency TEXT, PRIMARY KEY (name, dependency))""")
+        conn.execute("CREATE INDEX IF NOT EXISTS dependencies_dependency ON dependencies (dependency)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL)")
+    _connections[key] = conn
+    return conn
+
+
+def _entry(row):
+    (name, module, path, files, symbols, dependencies, content, build_time, size, created,
+     last_access, hits) = row
+    return CacheEntry(name=name, module=module, path=path, files=json.loads(files),
+                      symbols=json.loads(symbols), dependencies=json.loads(dependencies),
+                      content=content, build_time=build_time, size=size, created=created,
+                      last_access=last_access, hits=hits)
+
+
+def _insert(conn, name, rows, parameters, dependencies):
+    """Insert or replace the index entry of a module, given by a VALUES
+    or SELECT clause, and its links. Returns False if there was no row
+    to insert."""
+    _delete(conn, name)
+    if conn.execute("INSERT INTO modules " + rows, parameters).rowcount == 0:
+        return False
+    conn.executemany("INSERT OR IGNORE INTO dependencies VALUES (?, ?)",
+                     [(name, dependency) for dependency in dependencies])
+    return True
+
+
+def _delete(conn, name):
+    """Remove the index entry of a module and its links"""
+    conn.execute("DELETE FROM modules WHERE name = ?", (name, ))
+    conn.execute("DELETE FROM dependencies WHERE name = ?", (name, ))
+
+
+def _increment(conn, name, value):
+    conn.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)", (name, ))
+    conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+
+
+def find(cache_dir, module_name):
+    """Return the index entry of a published module, or None"""
+    if not pathlib.Path(cache_dir).joinpath(INDEX_FILE).exists():
+        return None
+    row = _connect(cache_dir).execute("SELECT * FROM modules WHERE name = ?", (module_name, )).fetchone()
+    return None if row is None else _entry(row)
+
+
+def find_content(cache_dir, content):
+    """Return the index entry of a built module with the given content
+    hash, or None"""
+    row = _connect(cache_dir).execute("SELECT * FROM modules WHERE content = ? AND name = module LIMIT 1",
+                                      (content, )).fetchone()
+    return None if row is None else _entry(row)
+
+
+def publish(cache_dir, module_name, path, symbols, build_time, dependencies, content):
+    """Record a freshly built module in the index, making it available
+    to other processes"""
+    cache_dir = pathlib.Path(cache_dir)
+    files = [str(cache_dir.joinpath(module_name + suffix)) for suffix in (".c", ".o", ".lock")]
+    files = [f for f in files if os.path.exists(f)] + [str(path)]
+    size = sum(os.path.getsize(f) for f in files)
+    now = time.time()
+
+    conn = _connect(cache_dir)
+    with conn:
+        _insert(conn, module_name, "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (module_name, module_name, str(path), json.dumps(files), json.dumps(list(symbols)),
+                 json.dumps(list(dependencies)), content, build_time, size, now, now),
+                dependencies)
+        _increment(conn, "misses", 1)
+        _increment(conn, "build_time_spent", build_time)
+
+
+def publish_alias(cache_dir, module_name, target, build_time):
+    """Record a module with the same content as the built module target,
+    providing the symbols of target. Returns False if target has been
+    evicted in the meantime."""
+    cache_dir = pathlib.Path(cache_dir)
+    files = [str(cache_dir.joinpath(module_name + ".lock"))]
+    files = [f for f in files if os.path.exists(f)]
+    now = time.time()
+
+    conn = _connect(cache_dir)
+    with conn:
+        # Depending on the target evicts the alias together with it
+        if not _insert(conn, module_name,
+                       "SELECT ?, module, path, ?, symbols, ?, content, ?, 0, ?, ?, 0 FROM modules WHERE name = ?",
+                       (module_name, json.dumps(files), json.dumps([target.name]),
+                        build_time, now, now, target.name),
+                       [target.name]):
+            return False
+        _increment(conn, "misses", 1)
+        _increment(conn, "deduplicated", 1)
+        _increment(conn, "build_time_spent", build_time)
+        _increment(conn, "build_time_saved", max(target.build_time - build_time, 0.0))
+    return True
+
+
+def unpublish(cache_dir, module_name):
+    """Remove the index entry of a module whose files have gone"""
+    conn = _connect(cache_dir)
+    with conn:
+        _delete(conn, module_name)
+
+
+def record_hit(cache_dir, module_name):
+    """Mark a module as used now and count a cache hit. This is on the
+    path of loading a module, so it does not wait for other processes
+    writing to the index; the hit is not recorded then."""
+    conn = _connect(cache_dir)
+    conn.execute("PRAGMA busy_timeout = 0")
+    try:
+        with conn:
+            conn.execute("UPDATE modules SET last_access = ?, hits = hits + 1 WHERE name = ?",
+                         (time.time(), module_name))
+            row = conn.execute("SELECT build_time FROM modules WHERE name = ?", (module_name, )).fetchone()
+            _increment(conn, "hits", 1)
+            if row is not None:
+                _increment(conn, "build_time_saved", row[0])
+    except sqlite3.OperationalError as e:
+        logger.debug("Not recording JIT cache hit of {}: {}".format(module_name, e))
+    finally:
+        conn.execute("PRAGMA busy_timeout = {}".format(int(1000 * _TIMEOUT)))
+
+
+def list_entries(cache_dir):
+    """Return all published modules, by module name"""
+    if not pathlib.Path(cache_dir).joinpath(INDEX_FILE).exists():
+        return {}
+    rows = _connect(cache_dir).execute("SELECT * FROM modules ORDER BY last_access")
+    return collections.OrderedDict((row[0], _entry(row)) for row in rows)
+
+
+def statistics(cache_dir):
+    """Return a dict of cache usage statistics"""
+    s = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "deduplicated": 0,
+         "build_time_saved": 0.0, "build_time_spent": 0.0}
+    if not pathlib.Path(cache_dir).joinpath(INDEX_FILE).exists():
+        return s
+
+    conn = _connect(cache_dir)
+    s["entries"], s["bytes"] = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM modules").fetchone()
+    for name, value in conn.execute("SELECT name, value FROM counters"):
+        s[name] = value if name.startswith("build_time") else int(value)
+    return s
+
+
+def _dependents(cache_dir, module_name):
+    return [row[0] for row in _connect(cache_dir).execute(
+        "SELECT name FROM dependencies WHERE dependency = ?", (module_name, ))]
+
+
+def _with_dependents(cache_dir, name, result):
+    """Append name after all modules linking to it, recursively"""
+    if name in result:
+        return
+    for dependent in _dependents(cache_dir, name):
+        _with_dependents(cache_dir, dependent, result)
+    if name not in result:
+        result.append(name)
+
+
+def _lock_module(cache_dir, module_name):
+    """Try to take the build lock of a module without waiting. Returns
+    the lock file descriptor, None if there is no lock file, or False
+    if the module is being built."""
+    if fcntl is None:
+        return None
+    try:
+        lock_fd = os.open(str(pathlib.Path(cache_dir).joinpath(module_name + ".lock")), os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(lock_fd)
+        return False
+    return lock_fd
+
+
+def _remove_files(files):
+    # Remove the lock last, while still holding it
+    for f in sorted(files, key=lambda f: f.endswith(".lock")):
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+
+
+def evict(cache_dir, module_name):
+    """Remove a module and every module linking to it. Returns the
+    names of the removed modules."""
+    names = []
+    _with_dependents(cache_dir, module_name, names)
+
+    conn = _connect(cache_dir)
+    removed = []
+    for name in names:
+        entry = find(cache_dir, name)
+        if entry is None:
+            continue
+        lock_fd = _lock_module(cache_dir, name)
+        if lock_fd is False:
+            # A module still being built must keep its dependencies
+            logger.info("Not evicting {}, it is being built".format(name))
+            break
+        try:
+            # Unpublish first so the module is never seen half removed
+            with conn:
+                _delete(conn, name)
+            _remove_files(entry.files)
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+        removed.append(name)
+
+    return removed
+
+
+def prune(cache_dir, max_size=0, max_entries=0, keep=()):
+    """Evict least recently used modules until the cache holds at most
+    max_size megabytes and max_entries modules (0 for no limit). The
+    same limits apply to the integrals stored for incremental
+    compilation. Returns the names of the removed modules."""
+    s = statistics(cache_dir)
+    size, count = s["bytes"], s["entries"]
+    max_bytes = max_size * 1024 * 1024
+
+    def over_limit():
+        return (max_size > 0 and size > max_bytes) or (max_entries > 0 and count > max_entries)
+
+    removed = []
+    for entry in list_entries(cache_dir).values():
+        if not over_limit():
+            break
+        if entry.name in keep or entry.name in removed:
+            continue
+        evicted = evict(cache_dir, entry.name)
+        if evicted:
+            removed += evicted
+            s = statistics(cache_dir)
+            size, count = s["bytes"], s["entries"]
+
+    if removed:
+        logger.info("Evicted {} modules from JIT cache".format(len(removed)))
+
+    from ffc.ir.ircache import prune_integrals
+    prune_integrals(pathlib.Path(cache_dir), max_size, max_entries)
+
+    return removed
+
+
+def clear(cache_dir):
+    """Remove all JIT modules, including partial builds and cached
+    representations, and reset the statistics. Returns the names of the removed modules."""
+    cache_dir = pathlib.Path(cache_dir)
+    if not cache_dir.exists():
+        return []
+
+    # Partial builds are not in the index, so look at all files here
+    files = collections.defaultdict(list)
+    build_dirs = {}
+    for f in os.scandir(cache_dir):
+        name = f.name.split(".")[0]
+        if name.startswith("libffc_") and f.is_file():
+            files[name].append(f.path)
+        elif f.name.startswith(BUILD_DIR_PREFIX) and f.is_dir():
+            build_dirs[f.name[len(BUILD_DIR_PREFIX):]] = f.path
+
+    conn = _connect(cache_dir)
+    removed = []
+    for name in set(files) | set(build_dirs):
+        lock_fd = _lock_module(cache_dir, name)
+        if lock_fd is False:
+            continue
+        try:
+            with conn:
+                _delete(conn, name)
+            if name in build_dirs:
+                shutil.rmtree(build_dirs[name], ignore_errors=True)
+            _remove_files(files.get(name, []))
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+        removed.append(name)
+
+    with conn:
+        conn.execute("DELETE FROM counters")
+
+    # Cached representations are not modules, but they would
+    # be left stale after clearing the cache
+    from ffc.ir.ircache import IR_CACHE_DIR, INTEGRAL_CACHE_DIR
+    for ir_dir in [IR_CACHE_DIR, INTEGRAL_CACHE_DIR]:
+        shutil.rmtree(str(cache_dir.joinpath(ir_dir)), ignore_errors=True)
+
+    return removed
+
+
+def main(args=None):
+    """Commandline tool to inspect and trim the JIT cache."""
+    from ffc.parameters import default_parameters
+    parameters = default_parameters()
+
+    parser = argparse.ArgumentParser(description="Manage the FFC JIT cache")
+    parser.add_argument("--cache-dir", type=str, default=parameters["cache_dir"],
+                        help="cache directory (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("stats", help="show cache usage statistics")
+    prune_parser = subparsers.add_parser("prune", help="evict least recently used modules")
+    prune_parser.add_argument("--max-size", type=int, default=parameters["cache_max_size"],
+                              help="max cache size in MB, 0 for no limit (default: %(default)s)")
+    prune_parser.add_argument("--max-entries", type=int, default=parameters["cache_max_entries"],
+                              help="max number of modules, 0 for no limit (default: %(default)s)")
+    subparsers.add_parser("clear", help="remove all modules")
+
+    xargs = parser.parse_args(args)
+    cache_dir = pathlib.Path(xargs.cache_dir).expanduser()
+
+    if xargs.command == "stats":
+        s = statistics(cache_dir)
+        lookups = s["hits"] + s["misses"]
+        print("Cache directory:  {}".format(cache_dir))
+        print("Modules:          {}".format(s["entries"]))
+        print("Size:             {:.1f} MB".format(s["bytes"] / (1024 * 1024)))
+        print("Hits:             {}".format(s["hits"]))
+        print("Misses:           {}".format(s["misses"]))
+        print("Deduplicated:     {}".format(s["deduplicated"]))
+        if lookups:
+            print("Hit rate:         {:.1f}%".format(100.0 * s["hits"] / lookups))
+        print("Build time saved: {:.1f} s".format(s["build_time_saved"]))
+        print("Build time spent: {:.1f} s".format(s["build_time_spent"]))
+    elif xargs.command == "prune":
+        removed = prune(cache_dir, xargs.max_size, xargs.max_entries)
+        print("Evicted {} modules".format(len(removed)))
+    elif xargs.command == "clear":
+        removed = clear(cache_dir)
+        print("Removed {} modules".format(len(removed)))
+
+    return 0
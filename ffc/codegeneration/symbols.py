@@ -52,12 +52,17 @@ def format_mt_name(basename, mt):
 class FFCBackendSymbols(object):
     """FFC specific symbol definitions. Provides non-ufl symbols."""
 
-    def __init__(self, language, coefficient_numbering, coefficient_offsets):
+    def __init__(self, language, coefficient_numbering, coefficient_offsets, batch=False):
         self.L = language
         self.S = self.L.Symbol
         self.coefficient_numbering = coefficient_numbering
         self.coefficient_offsets = coefficient_offsets
 
+        # Generating tabulate_tensor_batch, where the kernel arguments
+        # hold num_cells interleaved entities, entry k of cell ib
+        # stored at [k*num_cells + ib]
+        self.batch = batch
+
         # Used for padding variable names based on restriction
 #        self.restriction_postfix = {r: ufc_restriction_postfix(r) for r in ("+", "-", None)}
 
@@ -66,25 +71,70 @@ class FFCBackendSymbols(object):
         # True = XYZXYZXYZXYZ, False = XXXXYYYYZZZZ
         self.interleaved_components = True
 
+    def num_batch_cells(self):
+        """Number of cells, argument to tabulate_tensor_batch."""
+        return self.S("num_cells")
+
+    def batch_loop_index(self):
+        """Loop index over the cells of a batch."""
+        return self.S("ib")
+
+    def batch_block_index(self):
+        """Loop index over the blocks of cells of a batch."""
+        return self.S("kb")
+
+    def batch_block_begin(self):
+        """First cell of the current block of cells."""
+        return self.S("ib0")
+
+    def batch_block_end(self):
+        """End of the range of cells of the current block of cells."""
+        return self.S("ib1")
+
+    def _batch_access(self, symbol, index):
+        """Access entry index of the current cell in a kernel argument."""
+        if not self.batch:
+            return symbol[index]
+        ib = self.batch_loop_index()
+        if not isinstance(index, self.L.CExpr) and index == 0:
+            return symbol[ib]
+        return symbol[self.num_batch_cells() * index + ib]
+
     def element_tensor(self):
         """Symbol for the element tensor itself."""
         return self.S("A")
 
+    def element_tensor_array(self, shape):
+        """Flattened element tensor of given shape, indexed
+        like A[i, j] in both single cell and batch kernels."""
+        A = self.element_tensor()
+        if not self.batch:
+            return self.L.FlattenedArray(A, dims=shape)
+        # Cell index innermost, so pass it as the last index
+        return _BatchArray(self.L.FlattenedArray(A, dims=tuple(shape) + (self.num_batch_cells(), )),
+                           self.batch_loop_index())
+
     def entity(self, entitytype, restriction):
         """Entity index for lookup in element tables."""
         if entitytype == "cell":
             # Always 0 for cells (even with restriction)
             return self.L.LiteralInt(0)
         elif entitytype == "facet":
-            return self.S("facet" + ufc_restriction_postfix(restriction))
+            entity = self.S("facet" + ufc_restriction_postfix(restriction))
         elif entitytype == "vertex":
-            return self.S("vertex")
+            entity = self.S("vertex")
         else:
             logging.exception("Unknown entitytype {}".format(entitytype))
+        if self.batch:
+            return entity[self.batch_loop_index()]
+        return entity
 
     def cell_orientation_argument(self, restriction):
         """Cell orientation argument in ufc. Not same as cell orientation in generated code."""
-        return self.S("cell_orientation" + ufc_restriction_postfix(restriction))
+        co = self.S("cell_orientation" + ufc_restriction_postfix(restriction))
+        if self.batch:
+            return co[self.batch_loop_index()]
+        return co
 
     def cell_orientation_internal(self, restriction):
         """Internal value for cell orientation in generated code."""
@@ -95,6 +145,10 @@ class FFCBackendSymbols(object):
         indices = ["i", "j", "k", "l"]
         return self.S(indices[iarg])
 
+    def diagonal_loop_index(self):
+        """Loop index over the diagonal entries of a bilinear block."""
+        return self.S("ii")
+
     def coefficient_dof_sum_index(self):
         """Index for loops over coefficient dofs, assumed to never be used in two nested loops."""
         return self.S("ic")
@@ -145,9 +199,9 @@ class FFCBackendSymbols(object):
         # FIXME: Add domain number or offset!
         vc = self.S("coordinate_dofs" + ufc_restriction_postfix(restriction))
         if self.interleaved_components:
-            return vc[gdim * dof + component]
+            return self._batch_access(vc, gdim * dof + component)
         else:
-            return vc[num_scalar_dofs * component + dof]
+            return self._batch_access(vc, num_scalar_dofs * component + dof)
 
     def domain_dofs_access(self, gdim, num_scalar_dofs, restriction):
         # FIXME: Add domain number or offset!
@@ -160,7 +214,7 @@ class FFCBackendSymbols(object):
         # TODO: Add domain number?
         offset = self.coefficient_offsets[coefficient]
         w = self.S("w")
-        return w[offset + dof_number]
+        return self._batch_access(w, offset + dof_number)
 
     def coefficient_value(self, mt):
         """Symbol for variable holding value or derivative component of coefficient."""
@@ -181,3 +235,18 @@ class FFCBackendSymbols(object):
 
         # Return direct access to element table
         return self.S(tabledata.name)[entity][iq]
+
+
+class _BatchArray(object):
+    """Flattened batch array with the cell index appended to the given indices."""
+
+    __slots__ = ("array", "index")
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    def __getitem__(self, indices):
+        if not isinstance(indices, (list, tuple)):
+            indices = (indices, )
+        return self.array[tuple(indices) + (self.index, )]
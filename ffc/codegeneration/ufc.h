@@ -393,12 +393,38 @@ extern "C"
 
   // FIXME: Consider a common signature for tabulate_tensor
 
+  // tabulate_tensor_batch computes the element tensors of num_cells
+  // entities in one call. All arrays are interleaved with the cell
+  // index fastest, i.e. entry k of cell c is found at
+  // [k*num_cells + c]. It is NULL unless the integral was generated
+  // with the tabulate_tensor_batch parameter.
+
+  // tabulate_action computes the element vector of the action A x of
+  // a bilinear integral, where the dofs of x follow the coefficients
+  // in w. The element matrix is never formed. It is NULL unless the
+  // integral of a bilinear form was generated with the
+  // tabulate_action parameter.
+
+  // tabulate_diagonal computes the diagonal of the element tensor of a
+  // bilinear integral with the same test and trial element, i.e. the
+  // entries A[i][i] stored as A[i]. It is NULL unless the integral was
+  // generated with the tabulate_diagonal parameter.
+
   typedef struct ufc_cell_integral
   {
     const bool* enabled_coefficients;
     void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                             const double* restrict coordinate_dofs,
                             int cell_orientation);
+    void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                  const double* restrict coordinate_dofs,
+                                  int num_cells, const int* restrict cell_orientation);
+    void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs,
+                            int cell_orientation);
+    void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs,
+                            int cell_orientation);
   } ufc_cell_integral;
 
   typedef struct ufc_exterior_facet_integral
@@ -407,6 +433,16 @@ extern "C"
     void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                             const double* restrict coordinate_dofs, int facet,
                             int cell_orientation);
+    void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                  const double* restrict coordinate_dofs,
+                                  int num_cells, const int* restrict facet,
+                                  const int* restrict cell_orientation);
+    void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs, int facet,
+                            int cell_orientation);
+    void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs, int facet,
+                            int cell_orientation);
   } ufc_exterior_facet_integral;
 
   typedef struct ufc_interior_facet_integral
@@ -417,6 +453,23 @@ extern "C"
                             const double* restrict coordinate_dofs_1,
                             int facet_0, int facet_1, int cell_orientation_0,
                             int cell_orientation_1);
+    void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                  const double* restrict coordinate_dofs_0,
+                                  const double* restrict coordinate_dofs_1,
+                                  int num_cells, const int* restrict facet_0,
+                                  const int* restrict facet_1,
+                                  const int* restrict cell_orientation_0,
+                                  const int* restrict cell_orientation_1);
+    void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs_0,
+                            const double* restrict coordinate_dofs_1,
+                            int facet_0, int facet_1, int cell_orientation_0,
+                            int cell_orientation_1);
+    void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs_0,
+                            const double* restrict coordinate_dofs_1,
+                            int facet_0, int facet_1, int cell_orientation_0,
+                            int cell_orientation_1);
   } ufc_interior_facet_integral;
 
   typedef struct ufc_vertex_integral
@@ -425,6 +478,16 @@ extern "C"
     void (*tabulate_tensor)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
                             const double* restrict coordinate_dofs, int vertex,
                             int cell_orientation);
+    void (*tabulate_tensor_batch)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                                  const double* restrict coordinate_dofs,
+                                  int num_cells, const int* restrict vertex,
+                                  const int* restrict cell_orientation);
+    void (*tabulate_action)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs, int vertex,
+                            int cell_orientation);
+    void (*tabulate_diagonal)(ufc_scalar_t* restrict A, const ufc_scalar_t* w,
+                            const double* restrict coordinate_dofs, int vertex,
+                            int cell_orientation);
   } ufc_vertex_integral;
 
   typedef struct ufc_custom_integral
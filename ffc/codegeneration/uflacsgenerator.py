@@ -8,13 +8,15 @@
 source structure from factorized representation."""
 
 import collections
+import copy
 import itertools
 import logging
 
 
 import ufl
 from ffc.codegeneration.backend import FFCBackend
-from ffc.codegeneration.C.cnodes import pad_dim, pad_innermost_dim
+from ffc.codegeneration.C import cnodes
+from ffc.codegeneration.C.cnodes import collect_symbols, pad_dim, pad_innermost_dim
 from ffc.codegeneration.C.format_lines import format_indented_lines
 from ffc.ir.representationutils import initialize_integral_code
 from ffc.ir.uflacs.elementtables import piecewise_ttypes
@@ -45,17 +47,46 @@ def generate_integral_code(ir, prefix, parameters):
     # Generate generic ffc code snippets and add uflacs specific parts
     code = initialize_integral_code(ir, prefix, parameters)
     code["tabulate_tensor"] = body
+
+    # Generate the same kernel over a batch of cells
+    if parameters.get("tabulate_tensor_batch") and \
+       ir["integral_type"] not in ufl.measure.custom_integral_types:
+        batch_backend = FFCBackend(ir, parameters, batch=True)
+        batch_ig = IntegralGenerator(ir, batch_backend, precision)
+        batch_parts = batch_ig.generate()
+        code["tabulate_tensor_batch"] = format_indented_lines(batch_parts.cs_format(precision), 1)
+
+    # Generate the diagonal of the element tensor only
+    if parameters.get("tabulate_diagonal") and ir["has_diagonal"] and \
+       ir["integral_type"] not in ufl.measure.custom_integral_types and \
+       not _has_quadrature_arguments(ir):
+        diagonal_ig = IntegralGenerator(ir, FFCBackend(ir, parameters), precision, diagonal=True)
+        diagonal_parts = diagonal_ig.generate()
+        code["tabulate_diagonal"] = format_indented_lines(diagonal_parts.cs_format(precision), 1)
     code["additional_includes_set"] = set(ig.get_includes())
     code["additional_includes_set"].update(ir.get("additional_includes_set", ()))
 
     return code
 
 
+def _has_quadrature_arguments(ir):
+    """Check if any block has an argument in a quadrature element."""
+    irs = [ir["piecewise_ir"]] + [ir["varying_irs"][num_points] for num_points in ir["all_num_points"]]
+    return any("quadrature" in blockdata.ttypes
+               for expr_ir in irs
+               for contributions in expr_ir["block_contributions"].values()
+               for blockdata in contributions)
+
+
 class IntegralGenerator(object):
-    def __init__(self, ir, backend, precision):
+    def __init__(self, ir, backend, precision, diagonal=False):
         # Store ir
         self.ir = ir
 
+        # Compute only the diagonal A[i] of the element tensor A[i][j]
+        # of a bilinear integral
+        self.diagonal = diagonal
+
         # Formatting precision
         self.precision = precision
 
@@ -190,7 +221,7 @@ class IntegralGenerator(object):
         parts += self.generate_element_tables()
 
         # Generate code to compute piecewise constant scalar factors
-        parts += self.generate_unstructured_piecewise_partition()
+        piecewise_parts = self.generate_unstructured_piecewise_partition()
 
         # Loop generation code will produce parts to go before quadloops,
         # to define the quadloops, and to go after the quadloops
@@ -232,13 +263,142 @@ class IntegralGenerator(object):
         all_finalizeparts += self.generate_copyout_statements()
 
         # Collect parts before, during, and after quadrature loops
-        parts += all_preparts
-        parts += all_quadparts
-        parts += all_postparts
-        parts += all_finalizeparts
+        cell_parts = piecewise_parts + all_preparts + all_quadparts + all_postparts
+        cell_parts += all_finalizeparts
+
+        if self.backend.symbols.batch:
+            parts += self.generate_batch_loop(cell_parts)
+        else:
+            parts += cell_parts
 
         return L.StatementList(parts)
 
+    def generate_batch_loop(self, cell_parts):
+        """Generate the computation of the cells of a batch.
+
+        The cells are processed in blocks of batch_size cells. Every
+        statement depending on the cell is put in an innermost "omp
+        simd" loop over the cells of the block, so each cell is one
+        vector lane, and local variables depending on the cell get an
+        innermost dimension over the block. The loops over quadrature
+        points and dofs are outside the loops over cells. Static tables
+        are hoisted out of the loop over blocks.
+        """
+        L = self.backend.language
+
+        static_parts = []
+        body = []
+        for p in _flatten_statements(cell_parts):
+            if isinstance(p, L.ArrayDecl) and p.typename.startswith("static"):
+                static_parts.append(p)
+            else:
+                body.append(p)
+
+        num_cells = self.backend.symbols.num_batch_cells()
+        kb = self.backend.symbols.batch_block_index()
+        ib0 = self.backend.symbols.batch_block_begin()
+        ib1 = self.backend.symbols.batch_block_end()
+        size = self.ir["params"]["batch_size"]
+
+        varying = self.get_batch_varying_symbols(body)
+        end = L.Conditional(L.LT(ib0 + size, num_cells), ib0 + size, num_cells)
+        block = [L.VariableDecl("const int", ib0, size * kb),
+                 L.VariableDecl("const int", ib1, end)]
+        block += self.generate_batch_lanes(body, varying)
+
+        num_blocks = L.Div(num_cells + (size - 1), size)
+        loop = L.ForRange(kb, 0, num_blocks, body=block)
+        return static_parts + L.commented_code_list(loop, "Loop over blocks of cells in batch")
+
+    def get_batch_varying_symbols(self, statements):
+        """Return the names of the local variables depending on the cell."""
+        L = self.backend.language
+        ib = self.backend.symbols.batch_loop_index()
+
+        # Local variables assigned from values depending on the cell or
+        # on other such variables, until no more are found
+        assignments = []
+        for st in _flatten_statements(statements, recurse=True):
+            if isinstance(st, L.VariableDecl) and st.value is not None:
+                assignments.append((st.symbol.name, collect_symbols(st.value)))
+            elif isinstance(st, L.ArrayDecl) and not st.typename.startswith("static"):
+                assignments.append((st.symbol.name, collect_symbols(st.values)))
+            elif isinstance(st, L.Statement) and isinstance(st.expr, L.AssignOp):
+                target = st.expr.lhs
+                if isinstance(target, L.ArrayAccess):
+                    target = target.array
+                assignments.append((target.name, collect_symbols(st.expr)))
+
+        # Kernel arguments such as A are indexed by the cell already
+        declared = set(st.symbol.name for st in _flatten_statements(statements, recurse=True)
+                       if isinstance(st, (L.VariableDecl, L.ArrayDecl)))
+
+        varying = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, names in assignments:
+                if name in declared and name not in varying and (ib.name in names or names & varying):
+                    varying.add(name)
+                    changed = True
+        return varying
+
+    def generate_batch_lanes(self, statements, varying):
+        """Put the statements depending on the cell in loops over the
+        cells of a block, keeping loops over anything else outside."""
+        L = self.backend.language
+        ib = self.backend.symbols.batch_loop_index()
+        ib0 = self.backend.symbols.batch_block_begin()
+        ib1 = self.backend.symbols.batch_block_end()
+        size = self.ir["params"]["batch_size"]
+        alignas = self.ir["params"]["alignas"]
+        lane = ib - ib0
+
+        def depends_on_cell(node):
+            names = collect_symbols(node)
+            return ib.name in names or bool(names & varying)
+
+        parts = []
+        lane_parts = []
+
+        def flush():
+            if lane_parts:
+                parts.append(L.ForRange(ib, ib0, ib1, body=list(lane_parts), vectorize=True))
+                del lane_parts[:]
+
+        for st in _flatten_statements(statements):
+            if isinstance(st, L.Comment):
+                (lane_parts if lane_parts else parts).append(st)
+            elif isinstance(st, L.ForRange):
+                # Loops over quadrature points and dofs go around the
+                # loop over cells, which replaces their simd pragma
+                flush()
+                body = self.generate_batch_lanes(st.body, varying)
+                parts.append(L.ForRange(st.index, st.begin, st.end, body=body, index_type=st.index_type))
+            elif isinstance(st, L.Scope):
+                flush()
+                parts.append(L.Scope(self.generate_batch_lanes(st.body, varying)))
+            elif isinstance(st, L.VariableDecl) and st.symbol.name in varying:
+                typename = st.typename.replace("const ", "")
+                parts.append(L.ArrayDecl(typename, st.symbol, size, alignas=alignas))
+                if st.value is not None:
+                    lane_parts.append(L.Assign(st.symbol[lane], _lane_expr(st.value, varying, lane)))
+            elif isinstance(st, L.ArrayDecl) and st.symbol.name in varying:
+                if not (st.values is None or _is_zero(st.values)):
+                    raise RuntimeError("Not expecting initial values of local array {}.".format(st.symbol.name))
+                sizes = pad_innermost_dim(st.sizes, st.padlen) + (size, )
+                parts.append(L.ArrayDecl(st.typename, st.symbol, sizes, st.values, alignas=st.alignas))
+            elif isinstance(st, L.Statement) and depends_on_cell(st):
+                lane_parts.append(L.Statement(_lane_expr(st.expr, varying, lane)))
+            elif depends_on_cell(st):
+                raise RuntimeError("Cannot generate batch code for statement:\n{}".format(st))
+            else:
+                flush()
+                parts.append(st)
+        flush()
+
+        return parts
+
     def generate_quadrature_tables(self):
         """Generate static tables of quadrature points and weights."""
         L = self.backend.language
@@ -585,6 +745,10 @@ class IntegralGenerator(object):
 
         for blockmap, blockdata in blocks:
 
+            # Skip blocks without entries on the diagonal
+            if self.diagonal and not self.get_diagonal_pairs(blockmap):
+                continue
+
             # Define code for block depending on mode
             B, block_preparts, block_quadparts, block_postparts = \
                 self.generate_block_parts(num_points, blockmap, blockdata)
@@ -603,6 +767,47 @@ class IntegralGenerator(object):
 
         return preparts, quadparts, postparts
 
+    def get_tensor_shape(self):
+        """Return the shape of the element tensor computed by the kernel."""
+        if self.diagonal:
+            return self.ir["tensor_shape"][:1]
+        return self.ir["tensor_shape"]
+
+    def get_diagonal_pairs(self, blockmap):
+        """Return the pairs of block indices (i, j) of a bilinear block
+        with the same dof of A, i.e. on the diagonal of A."""
+        trial_dofs = {dof: j for j, dof in enumerate(blockmap[1])}
+        return [(i, trial_dofs[dof]) for i, dof in enumerate(blockmap[0]) if dof in trial_dofs]
+
+    def generate_diagonal_loop(self, pairs, body, parts):
+        """Generate a loop over pairs of block indices, defining the
+        argument loop indices i and j of each pair used in body.
+
+        Static tables of the indices are added to parts unless the
+        indices are contiguous.
+        """
+        L = self.backend.language
+        ii = self.backend.symbols.diagonal_loop_index()
+        body = L.as_cstatement(body)
+        names = collect_symbols(body)
+
+        decls = []
+        for k in range(2):
+            index = self.backend.symbols.argument_loop_index(k)
+            if index.name not in names:
+                continue
+            values = [pair[k] for pair in pairs]
+            begin = values[0]
+            if values == list(range(begin, begin + len(values))):
+                value = ii + begin if begin else ii
+            else:
+                DI = self.new_temp_symbol("DI")
+                parts.append(L.ArrayDecl("static const int", DI, len(values), values))
+                value = DI[ii]
+            decls.append(L.VariableDecl("const int", index, value))
+
+        return L.ForRange(ii, 0, len(pairs), body=decls + [body])
+
     def get_entities(self, blockdata):
         L = self.backend.language
 
@@ -692,12 +897,14 @@ class IntegralGenerator(object):
             "full": "BF",
             "safe": "BS",
             "quadrature": "BQ",
+            "sumfactorized": "BT",
         }
 
         tempname = tempnames.get(blockdata.block_mode)
 
         alignas = self.ir["params"]["alignas"]
         padlen = self.ir["params"]["padlen"]
+        vectorize = self.ir["params"]["vectorize"]
 
         block_rank = len(blockmap)
         blockdims = tuple(len(dofmap) for dofmap in blockmap)
@@ -725,14 +932,29 @@ class IntegralGenerator(object):
                 B_indices.append(arg_indices[i])
         B_indices = tuple(B_indices)
 
+        # Compute only the entries of the block on the diagonal of A,
+        # with B indexed by the diagonal loop index
+        if self.diagonal:
+            diagonal_pairs = self.get_diagonal_pairs(blockmap)
+            diagonal_index = self.backend.symbols.diagonal_loop_index()
+
+        # Sum factorization computes the diagonal only when both
+        # arguments have the dofs of the same element, otherwise the
+        # full block is computed and its diagonal picked in copyout
+        diagonal_block = self.diagonal
+        if (self.diagonal and len(blockmap) == 2 and blockdata.block_mode == "sumfactorized"
+                and blockmap[0] != blockmap[1]):
+            diagonal_block = False
+
         # Define unique block symbol
         blockname = blocknames.get(blockdata.block_mode)
         if blockname:
             B = self.new_temp_symbol(blockname)
+            B_dims = len(diagonal_pairs) if diagonal_block else blockdims
             # Add initialization of this block to parts
             # For all modes, block definition occurs before quadloop
             preparts.append(
-                L.ArrayDecl("ufc_scalar_t", B, blockdims, 0, alignas=alignas, padlen=padlen))
+                L.ArrayDecl("ufc_scalar_t", B, B_dims, 0, alignas=alignas, padlen=padlen))
 
         # Get factor expression
         if blockdata.factor_is_piecewise:
@@ -786,13 +1008,20 @@ class IntegralGenerator(object):
             # Naively accumulate integrand for this block in the innermost loop
             assert not blockdata.transposed
             B_rhs = L.float_product([fw] + arg_factors)
-            body = L.AssignAdd(B[B_indices], B_rhs)  # NB! += not =
-            for i in reversed(range(block_rank)):
-                body = L.ForRange(B_indices[i], 0, padded_blockdims[i], body=body)
+            if self.diagonal:
+                body = L.AssignAdd(B[diagonal_index], B_rhs)
+                body = self.generate_diagonal_loop(diagonal_pairs, body, preparts)
+            else:
+                body = L.AssignAdd(B[B_indices], B_rhs)  # NB! += not =
+                for i in reversed(range(block_rank)):
+                    # Vectorize only the innermost loop
+                    body = L.ForRange(B_indices[i], 0, padded_blockdims[i], body=body,
+                                      vectorize=vectorize and (i == block_rank - 1),
+                                      aligned=[B], alignas=alignas)
             quadparts += [body]
 
             # Define rhs expression for A[blockmap[arg_indices]] += A_rhs
-            A_rhs = B[arg_indices]
+            A_rhs = B[diagonal_index] if self.diagonal else B[arg_indices]
 
         elif blockdata.block_mode == "full":
             assert not blockdata.transposed, "Not handled yet"
@@ -825,24 +1054,35 @@ class IntegralGenerator(object):
                     P_rhs = L.float_product([fw, arg_factors[i]])
                     body = L.Assign(P[P_index], P_rhs)
                     # if ttypes[i] != "quadrature":  # FIXME: What does this mean here?
-                    vectorize = self.ir["params"]["vectorize"]
-                    body = L.ForRange(P_index, 0, P_dim, body=body, vectorize=vectorize)
+                    # Run over the padding of P and the tables to
+                    # avoid a scalar remainder loop
+                    if vectorize and ttypes[i] != "quadrature":
+                        P_end = pad_dim(P_dim, padlen)
+                    else:
+                        P_end = P_dim
+                    body = L.ForRange(P_index, 0, P_end, body=body, vectorize=vectorize,
+                                      aligned=[P], alignas=alignas)
                     quadparts.append(body)
 
                 B_rhs = P[P_index] * arg_factors[j]
 
             # Add result to block inside quadloop
-            body = L.AssignAdd(B[B_indices], B_rhs)  # NB! += not =
-            for i in reversed(range(block_rank)):
-                # Vectorize only the innermost loop
-                vectorize = self.ir["params"]["vectorize"] and (i == block_rank - 1)
-                if ttypes[i] != "quadrature":
-                    body = L.ForRange(
-                        B_indices[i], 0, padded_blockdims[i], body=body, vectorize=vectorize)
+            if self.diagonal:
+                body = L.AssignAdd(B[diagonal_index], B_rhs)
+                body = self.generate_diagonal_loop(diagonal_pairs, body, preparts)
+            else:
+                body = L.AssignAdd(B[B_indices], B_rhs)  # NB! += not =
+                for i in reversed(range(block_rank)):
+                    # Vectorize only the innermost loop
+                    if ttypes[i] != "quadrature":
+                        body = L.ForRange(
+                            B_indices[i], 0, padded_blockdims[i], body=body,
+                            vectorize=vectorize and (i == block_rank - 1),
+                            aligned=[B], alignas=alignas)
             quadparts += [body]
 
             # Define rhs expression for A[blockmap[arg_indices]] += A_rhs
-            A_rhs = B[arg_indices]
+            A_rhs = B[diagonal_index] if self.diagonal else B[arg_indices]
 
         elif blockdata.block_mode == "partial":
             # TODO: To handle transpose here, must add back intermediate block B
@@ -869,7 +1109,8 @@ class IntegralGenerator(object):
 
                 # Accumulate P += weight * f * args in quadrature loop
                 body = L.AssignAdd(P[P_index], P_rhs)
-                body = L.ForRange(P_index, 0, pad_dim(P_dim, padlen), body=body)
+                body = L.ForRange(P_index, 0, pad_dim(P_dim, padlen), body=body,
+                                  vectorize=vectorize, aligned=[P], alignas=alignas)
                 quadparts.append(body)
 
             # Define B = B_rhs = piecewise_argument[:] * P[:],
@@ -879,6 +1120,18 @@ class IntegralGenerator(object):
             # Define rhs expression for A[blockmap[arg_indices]] += A_rhs
             A_rhs = B_rhs
 
+        elif blockdata.block_mode == "sumfactorized":
+            # Store f*weight in quadloop, sum over one direction at a
+            # time after quadloop
+            parts = self.generate_sum_factorization(num_points, iq, blockdata, B, f, weight,
+                                                    diagonal_block)
+            preparts += parts[0]
+            quadparts += parts[1]
+            postparts += parts[2]
+
+            # Define rhs expression for A[blockmap[arg_indices]] += A_rhs
+            A_rhs = B[diagonal_index] if diagonal_block else B[arg_indices]
+
         elif blockdata.block_mode in ("premultiplied", "preintegrated"):
             P_ii = self.get_entities(blockdata)
             if blockdata.transposed:
@@ -918,6 +1171,111 @@ class IntegralGenerator(object):
 
         return A_rhs, preparts, quadparts, postparts
 
+    def generate_sum_factorization(self, num_points, iq, blockdata, B, f, weight, diagonal=False):
+        """Generate code integrating a block of tensor product element
+        tables on quadrilaterals and hexahedra.
+
+        The values of f*weight are stored for all quadrature points
+        inside the quadloop. After the quadloop the sum over points is
+        carried out one reference direction at a time, with a table of
+        the interval element along that direction for each argument.
+        For n dofs and m points per direction on a cell of dimension d,
+        this costs O(n^{2d} m) instead of O(n^{2d} m^d) for a bilinear
+        block, and O(n^d m) instead of O(n^d m^d) for a linear block or
+        the diagonal of a bilinear block, computed if diagonal is true.
+        """
+        L = self.backend.language
+
+        alignas = self.ir["params"]["alignas"]
+        vectorize = self.ir["params"]["vectorize"]
+        tables = self.ir["unique_tables"]
+
+        # Table names for each argument and direction, with axes
+        # (point, dof)
+        factor_names = blockdata.tensor_factors
+        rank = len(factor_names)
+        tdim = len(factor_names[0])
+        num_points_1d = [tables[name].shape[0] for name in factor_names[0]]
+        num_dofs_1d = [[tables[name].shape[1] for name in names] for names in factor_names]
+
+        preparts = []
+        quadparts = []
+        postparts = []
+
+        # Store f*weight in each quadrature point
+        key = (num_points, blockdata.factor_index, blockdata.factor_is_piecewise)
+        FQ, defined = self.get_temp_symbol("FQ", key)
+        if not defined:
+            preparts.append(L.ArrayDecl("ufc_scalar_t", FQ, num_points, None, alignas=alignas))
+            quadparts.append(L.Assign(FQ[iq], L.float_product([f, weight])))
+
+        # On the diagonal the arguments share one loop over dofs in
+        # each direction
+        num_loops = 1 if diagonal else rank
+
+        point_indices = [L.Symbol("q%d" % k) for k in range(tdim)]
+        dof_indices = [[L.Symbol("%s%d" % (self.backend.symbols.argument_loop_index(a).name, k))
+                        for k in range(tdim)] for a in range(num_loops)]
+
+        # The array summed over direction k has axes for the points in
+        # directions k, ..., tdim-1 followed by the dofs in directions
+        # 0, ..., k-1 of each argument. The first array is FQ.
+        S_in = L.FlattenedArray(FQ, dims=num_points_1d)
+        for k in range(tdim):
+            q = point_indices[k]
+            rest_indices = point_indices[k + 1:]
+            prefix_indices = [dof_indices[a][i] for i in range(k) for a in range(num_loops)]
+            new_indices = [dof_indices[a][k] for a in range(num_loops)]
+
+            if k < tdim - 1:
+                dims = (num_points_1d[k + 1:]
+                        + [num_dofs_1d[a][i] for i in range(k + 1) for a in range(num_loops)])
+                S_out = self.new_temp_symbol("ST")
+                postparts.append(L.ArrayDecl("ufc_scalar_t", S_out, dims, 0, alignas=alignas))
+                out = S_out[tuple(rest_indices + prefix_indices + new_indices)]
+                S_next = S_out
+            else:
+                # Sum into block with dofs numbered last direction fastest
+                B_indices = []
+                for a in range(num_loops):
+                    index = dof_indices[a][tdim - 1]
+                    stride = 1
+                    for i in reversed(range(tdim - 1)):
+                        stride *= num_dofs_1d[a][i + 1]
+                        index = index + stride * dof_indices[a][i]
+                    B_indices.append(index)
+                out = B[tuple(B_indices)]
+                S_next = None
+
+            # out[..., i, j] += S_in[q, ...] * U[q][i] * V[q][j],
+            # multiplying in one argument table per loop level
+            if diagonal:
+                factors = [L.float_product([L.Symbol(factor_names[a][k])[q][new_indices[0]]
+                                            for a in range(rank)])]
+            else:
+                factors = [L.Symbol(factor_names[a][k])[q][new_indices[a]] for a in range(rank)]
+            fs = [L.Symbol("fs")] + [L.Symbol("fs%d" % a) for a in range(num_loops - 1)]
+            body = L.AssignAdd(out, L.float_product([fs[num_loops - 1], factors[num_loops - 1]]))
+            body = L.ForRange(new_indices[num_loops - 1], 0, num_dofs_1d[num_loops - 1][k], body=body,
+                              vectorize=vectorize)
+            for a in reversed(range(num_loops - 1)):
+                value = L.float_product([fs[a], factors[a]])
+                body = L.ForRange(new_indices[a], 0, num_dofs_1d[a][k],
+                                  body=[L.VariableDecl("const ufc_scalar_t", fs[a + 1], value), body])
+            value = S_in[tuple([q] + rest_indices + prefix_indices)]
+            body = L.ForRange(q, 0, num_points_1d[k],
+                              body=[L.VariableDecl("const ufc_scalar_t", fs[0], value), body])
+
+            # Loop over the remaining points and the dofs of previous directions
+            outer_dims = (num_points_1d[k + 1:]
+                          + [num_dofs_1d[a][i] for i in range(k) for a in range(num_loops)])
+            for index, dim in reversed(list(zip(rest_indices + prefix_indices, outer_dims))):
+                body = L.ForRange(index, 0, dim, body=body)
+            postparts.append(body)
+            S_in = S_next
+
+        return preparts, quadparts, postparts
+
     def generate_preintegrated_dofblock_partition(self):
         # FIXME: Generalize this to unrolling all A[] += ... loops,
         # or all loops with noncontiguous DM??
@@ -930,7 +1288,7 @@ class IntegralGenerator(object):
                   for blockdata in contributions if blockdata.block_mode == "preintegrated"]
 
         # Get symbol, dimensions, and loop index symbols for A
-        A_shape = self.ir["tensor_shape"]
+        A_shape = self.get_tensor_shape()
         A_size = ufl.product(A_shape)
         A_rank = len(A_shape)
 
@@ -966,11 +1324,15 @@ class IntegralGenerator(object):
                 assert table.shape[0] == 1
 
             # Unroll loop
-            blockshape = [len(DM) for DM in blockmap]
-            blockrange = [range(d) for d in blockshape]
+            if self.diagonal:
+                block_indices = self.get_diagonal_pairs(blockmap)
+            else:
+                blockshape = [len(DM) for DM in blockmap]
+                blockrange = [range(d) for d in blockshape]
+                block_indices = itertools.product(*blockrange)
 
-            for ii in itertools.product(*blockrange):
-                A_ii = sum(A_strides[i] * blockmap[i][ii[i]] for i in range(len(ii)))
+            for ii in block_indices:
+                A_ii = sum(A_strides[i] * blockmap[i][ii[i]] for i in range(A_rank))
                 if blockdata.transposed:
                     P_arg_indices = (ii[1], ii[0])
                 else:
@@ -996,8 +1358,8 @@ class IntegralGenerator(object):
         parts = []
 
         L = self.backend.language
-        A = self.backend.symbols.element_tensor()
         A_size = len(A_values)
+        A = self.backend.symbols.element_tensor_array((A_size, ))
 
         init_mode = self.ir["params"]["tensor_init_mode"]
         z = L.LiteralFloat(0.0)
@@ -1055,11 +1417,10 @@ class IntegralGenerator(object):
         parts = []
 
         # Get symbol, dimensions, and loop index symbols for A
-        A_shape = self.ir["tensor_shape"]
+        A_shape = self.get_tensor_shape()
         A_rank = len(A_shape)
 
-        Asym = self.backend.symbols.element_tensor()
-        A = L.FlattenedArray(Asym, dims=A_shape)
+        A = self.backend.symbols.element_tensor_array(A_shape)
 
         indices = [self.backend.symbols.argument_loop_index(i) for i in range(A_rank)]
 
@@ -1099,8 +1460,13 @@ class IntegralGenerator(object):
 
             # Add components of all B's to A component in loop nest
             body = L.AssignAdd(A[A_indices], term)
-            for i in reversed(range(A_rank)):
-                body = L.ForRange(indices[i], 0, len(blockmap[i]), body=body)
+            if self.diagonal:
+                # Loop over the diagonal of the block, A indexed by i
+                body = self.generate_diagonal_loop(self.get_diagonal_pairs(blockmap), body,
+                                                   dofmap_parts)
+            else:
+                for i in reversed(range(A_rank)):
+                    body = L.ForRange(indices[i], 0, len(blockmap[i]), body=body)
 
             # Add this block to parts
             parts.append(body)
@@ -1109,3 +1475,55 @@ class IntegralGenerator(object):
         parts = dofmap_parts + parts
 
         return parts
+
+
+def _flatten_statements(statements, recurse=False):
+    """Return the statements of nested statement lists, and with
+    recurse=True also the statements in loops and scopes."""
+    L = cnodes
+    result = []
+    stack = [statements]
+    while stack:
+        st = stack.pop()
+        if isinstance(st, list):
+            stack.extend(reversed(st))
+        elif isinstance(st, L.StatementList):
+            stack.extend(reversed(st.statements))
+        elif recurse and isinstance(st, (L.ForRange, L.Scope)):
+            stack.append(st.body)
+        elif isinstance(st, L.CExpr):
+            result.append(L.Statement(st))
+        else:
+            result.append(st)
+    return result
+
+
+def _is_zero(values):
+    """Check if values initialize an array to zero."""
+    return isinstance(values, (int, float)) and values == 0
+
+
+def _lane_expr(expr, varying, lane):
+    """Index the local variables named in varying by lane."""
+    L = cnodes
+
+    def transform(node):
+        if isinstance(node, L.Symbol):
+            if node.name in varying:
+                return node[lane]
+            return node
+        elif isinstance(node, L.ArrayAccess) and node.array.name in varying:
+            return L.ArrayAccess(node.array, tuple(transform(i) for i in node.indices) + (lane, ))
+        elif isinstance(node, (list, tuple)):
+            return type(node)(transform(v) for v in node)
+        elif isinstance(node, L.CNode):
+            node = copy.copy(node)
+            for cls in type(node).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    value = getattr(node, slot, None)
+                    if isinstance(value, (L.CNode, list, tuple)):
+                        setattr(node, slot, transform(value))
+            return node
+        return node
+
+    return transform(expr)
@@ -70,6 +70,7 @@ from typing import Dict, List, Tuple, Union
 
 from ffc.analysis import analyze_ufl_objects
 from ffc.codegeneration.codegeneration import generate_code
+from ffc.fiatinterface import configure_element_cache
 from ffc.formatting import format_code
 from ffc.parameters import validate_parameters
 from ffc.ir.representation import compute_ir
@@ -105,6 +106,7 @@ def compile_ufl_objects(ufl_objects: Union[List, Tuple],
     # this is only for commandline and direct call from python
     if not jit:
         parameters = validate_parameters(parameters)
+    configure_element_cache(parameters)
 
     # Check input arguments
     if not isinstance(ufl_objects, (list, tuple)):
@@ -5,6 +5,7 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import copyreg
 import logging
 import warnings
 
@@ -13,11 +14,15 @@ import numpy
 import FIAT
 import ufl
 from FIAT.enriched import EnrichedElement
+from FIAT.expansions import (LineExpansionSet, TetrahedronExpansionSet,
+                             TriangleExpansionSet)
 from FIAT.mixed import MixedElement
 from FIAT.nodal_enriched import NodalEnrichedElement
 from FIAT.quadrature_element import QuadratureElement
 from FIAT.restricted import RestrictedElement
 from FIAT.tensor_product import FlattenedDimensions
+from ffc.ir.ircache import cached_fiat_element, cached_quadrature
+from ffc.lrucache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +33,28 @@ supported_families = ("Brezzi-Douglas-Marini", "Brezzi-Douglas-Fortin-Marini", "
                       "Radau", "Raviart-Thomas", "Real", "Bubble", "Quadrature", "Regge",
                       "Hellan-Herrmann-Johnson", "Q", "DQ", "TensorProductElement")
 
-# Cache for computed elements
-_cache = {}
+# Cache for computed elements, see configure_element_cache
+_cache = LRUCache(maxsize=256)
+_cache_parameters = None
+
+# Quadrature rules by shape, degree and scheme, shared by all integrals
+# compiled by this process
+_quadrature_cache = LRUCache(maxsize=256)
+
+
+def _reduce_expansion_set(expansion_set):
+    # Expansion sets hold lambdas, which cannot be pickled, but are
+    # cheap to recreate from the reference cell
+    return type(expansion_set), (expansion_set.ref_el, )
+
+
+def _register_expansion_set_pickling():
+    """Make FIAT elements picklable for the disk cache. This changes
+    how pickle handles FIAT classes in the whole process, so it is only
+    done once the disk cache is enabled."""
+    for expansion_set in (LineExpansionSet, TriangleExpansionSet, TetrahedronExpansionSet):
+        if copyreg.dispatch_table.get(expansion_set) is not _reduce_expansion_set:
+            copyreg.pickle(expansion_set, _reduce_expansion_set)
 
 
 class SpaceOfReals(object):
@@ -47,16 +72,45 @@ def reference_cell_vertices(cellname):
     return cell.get_vertices()
 
 
+def configure_element_cache(parameters):
+    """Set the capacity of the element cache from the parameter
+    element_cache_size, and store elements on disk if ir_cache is set."""
+    global _cache_parameters
+    maxsize = int(parameters.get("element_cache_size", 0))
+    _cache.resize(maxsize if maxsize > 0 else None)
+    if parameters.get("ir_cache"):
+        _register_expansion_set_pickling()
+        _cache_parameters = {"ir_cache": True, "cache_dir": parameters["cache_dir"]}
+    else:
+        _cache_parameters = None
+
+
+def element_cache_statistics():
+    """Return the number of hits, misses and elements of the element cache."""
+    return {"hits": _cache.hits, "misses": _cache.misses, "size": len(_cache), "maxsize": _cache.maxsize}
+
+
 def create_element(ufl_element):
 
     # Create element signature for caching (just use UFL element)
     element_signature = ufl_element
 
     # Check cache
-    if element_signature in _cache:
+    element = _cache.get(element_signature)
+    if element is not None:
         logger.debug("Reusing element from cache")
-        return _cache[element_signature]
+        return element
 
+    element = cached_fiat_element(repr(ufl_element), _cache_parameters,
+                                  lambda: _create_element(ufl_element))
+
+    # Store in cache
+    _cache[element_signature] = element
+
+    return element
+
+
+def _create_element(ufl_element):
     if isinstance(ufl_element, ufl.FiniteElement):
         element = _create_fiat_element(ufl_element)
     elif isinstance(ufl_element, ufl.MixedElement):
@@ -72,9 +126,6 @@ def create_element(ufl_element):
         element = _create_restricted_element(ufl_element)
         raise RuntimeError("Cannot handle this element type: {}".format(ufl_element))
 
-    # Store in cache
-    _cache[element_signature] = element
-
     return element
 
 
@@ -165,7 +216,22 @@ def create_quadrature(shape, degree, scheme="default"):
     """Generate quadrature rule (points, weights) for given shape
     that will integrate an polynomial of order 'degree' exactly.
 
+    The rules are cached, also on disk if the parameter ir_cache is
+    set, so the returned arrays are shared and read-only.
+
     """
+    key = (shape, degree, scheme)
+    rule = _quadrature_cache.get(key)
+    if rule is None:
+        rule = cached_quadrature(repr(key), _cache_parameters,
+                                 lambda: _create_quadrature(shape, degree, scheme))
+        for array in rule:
+            array.setflags(write=False)
+        _quadrature_cache[key] = rule
+    return rule
+
+
+def _create_quadrature(shape, degree, scheme):
     if isinstance(shape, int) and shape == 0:
         return (numpy.zeros((1, 0)), numpy.ones((1, )))
 
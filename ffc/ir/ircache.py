@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Disk cache for the intermediate representation of elements, dofmaps
+and coordinate mappings, and for the representation and code of
+integrals.
+
+The cached part of an element representation only depends on the UFL
+element and a few parameters, not on the forms it was found in, so it
+is shared by all compilations using the same element.
+
+Integrals are cached by a signature of their integrands, metadata and
+the parts of the form they are compiled with, so that recompiling a
+file after editing some of its integrals only regenerates those. The
+least recently used integrals are removed to keep within the limits of
+the JIT cache, cache_max_size and cache_max_entries.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import ffc
+
+logger = logging.getLogger(__name__)
+
+# Subdirectories of the cache directory holding the representations
+IR_CACHE_DIR = "libffc-ir"
+INTEGRAL_CACHE_DIR = "libffc-integrals"
+
+
+def _signature(*signatures):
+    from ffc.git_commit_hash import git_commit_hash
+    signatures = list(signatures) + [str(ffc.__version__), git_commit_hash()]
+    return hashlib.sha1(";".join(signatures).encode('utf-8')).hexdigest()
+
+
+def _ir_cache_key(kind, ufl_element, key_parameters):
+    return _signature(kind, repr(ufl_element), repr(key_parameters))
+
+
+def _load(filename):
+    try:
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("Ignoring unreadable IR cache file " + str(filename))
+    return None
+
+
+def _store(filename, obj):
+    # Write to a temporary file first, so readers never see partial files
+    os.makedirs(filename.parent, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=str(filename.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, str(filename))
+    except (pickle.PicklingError, AttributeError, TypeError):
+        # Not all objects can be stored, they are just recomputed
+        logger.debug("Not storing unpicklable object in IR cache file " + str(filename))
+        os.remove(tmp_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+def cached_ir(kind, ufl_element, key_parameters, parameters, compute_ir):
+    """Return compute_ir(), loaded from the IR cache if it has been
+    computed before for the same kind, element and key parameters.
+
+    The cache is only used if the parameter ir_cache is set.
+    """
+    if not parameters.get("ir_cache"):
+        return compute_ir()
+
+    return _cached(parameters, _ir_cache_key(kind, ufl_element, key_parameters) + ".pickle", compute_ir)
+
+
+def cached_tabulation(signature, parameters, tabulate):
+    """Return tabulate(), loaded from the IR cache if a tabulation with
+    the same signature has been stored before.
+
+    The cache is only used if the parameter ir_cache is set.
+    """
+    if not parameters or not parameters.get("ir_cache"):
+        return tabulate()
+
+    return _cached(parameters, "tabulation-" + _signature(signature) + ".pickle", tabulate)
+
+
+def cached_fiat_element(signature, parameters, create_element):
+    """Return create_element(), loaded from the IR cache if an element
+    with the same signature has been stored before.
+
+    The cache is only used if the parameter ir_cache is set.
+    """
+    if not parameters or not parameters.get("ir_cache"):
+        return create_element()
+
+    import FIAT
+    return _cached(parameters, "element-" + _signature(signature, FIAT.__version__) + ".pickle", create_element)
+
+
+def cached_quadrature(signature, parameters, create_quadrature):
+    """Return create_quadrature(), loaded from the IR cache if a
+    quadrature rule with the same signature has been stored before.
+
+    The cache is only used if the parameter ir_cache is set.
+    """
+    if not parameters or not parameters.get("ir_cache"):
+        return create_quadrature()
+
+    import FIAT
+    return _cached(parameters, "quadrature-" + _signature(signature, FIAT.__version__) + ".pickle",
+                   create_quadrature)
+
+
+def _cached(parameters, name, compute):
+    from ffc.codegeneration.jitcache import get_cache_dir
+    filename = get_cache_dir(parameters).joinpath(IR_CACHE_DIR, name)
+
+    value = _load(filename)
+    if value is None:
+        value = compute()
+        _store(filename, value)
+
+    return value
+
+
+def integral_signature(itg_data, form_data, form_index, prefix, parameters):
+    """Return a signature of everything the representation and code of
+    an integral depend on."""
+    from ufl.algorithms.signature import compute_expression_signature
+    from ufl.utils.sorting import canonicalize_metadata, sorted_by_count
+    from ffc.parameters import compute_jit_signature
+
+    # Number coefficients as in the generated code, and domains as in
+    # the form signature
+    renumbering = dict(form_data.original_form.domain_numbering())
+    for i, f in enumerate(sorted_by_count(form_data.function_replace_map.keys())):
+        renumbering[f] = i
+        renumbering[form_data.function_replace_map[f]] = i
+        domain = f.ufl_domain()
+        if domain is not None and domain not in renumbering:
+            renumbering[domain] = len(renumbering)
+
+    integrands = [compute_expression_signature(itg.integrand(), renumbering) for itg in itg_data.integrals]
+    metadata = [repr(canonicalize_metadata(itg.metadata())) for itg in itg_data.integrals]
+
+    return _signature(prefix, str(form_index), itg_data.integral_type, repr(itg_data.subdomain_id),
+                      repr(itg_data.domain.ufl_coordinate_element()), repr(integrands), repr(metadata),
+                      repr(canonicalize_metadata(itg_data.metadata)), repr(itg_data.enabled_coefficients),
+                      repr(form_data.argument_elements), repr(form_data.coefficient_elements),
+                      repr(sorted(repr(e) for e in form_data.unique_elements)),
+                      form_data.representation, compute_jit_signature(parameters))
+
+
+def load_integral(signature, classnames, parameters):
+    """Return the representation of an integral with its generated code
+    under the key "cached_code", or None if it is not cached."""
+    from ffc.codegeneration.jitcache import get_cache_dir
+    filename = get_cache_dir(parameters).joinpath(INTEGRAL_CACHE_DIR, signature + ".pickle")
+    cached = _load(filename)
+    if cached is None:
+        return None
+
+    # The modification time marks the last use, for pruning
+    try:
+        os.utime(str(filename))
+    except OSError:
+        pass
+
+    ir, code = cached
+    # The classnames of all elements in the compiled files are stored
+    # with the representation, but the integral only uses its own
+    ir["classnames"] = classnames
+    ir["incremental_signature"] = signature
+    ir["cached_code"] = code
+    return ir
+
+
+def store_integral(ir, code, parameters):
+    """Store the representation and generated code of an integral."""
+    from ffc.codegeneration.jitcache import get_cache_dir
+    cache_dir = get_cache_dir(parameters)
+    filename = cache_dir.joinpath(INTEGRAL_CACHE_DIR, ir["incremental_signature"] + ".pickle")
+    _store(filename, (ir, code))
+
+    max_size = int(parameters.get("cache_max_size", 0))
+    max_entries = int(parameters.get("cache_max_entries", 0))
+    if max_size > 0 or max_entries > 0:
+        prune_integrals(cache_dir, max_size, max_entries, keep=[filename.name])
+
+
+def prune_integrals(cache_dir, max_size=0, max_entries=0, keep=()):
+    """Remove least recently used integrals until the integral cache
+    holds at most max_size megabytes and max_entries integrals (0 for
+    no limit). Returns the number of removed integrals."""
+    files = []
+    try:
+        for f in os.scandir(str(cache_dir.joinpath(INTEGRAL_CACHE_DIR))):
+            if f.name.endswith(".pickle"):
+                stat = f.stat()
+                files.append((stat.st_mtime, stat.st_size, f.name, f.path))
+    except FileNotFoundError:
+        return 0
+
+    size, count = sum(f[1] for f in files), len(files)
+    max_bytes = max_size * 1024 * 1024
+
+    removed = 0
+    for _, file_size, name, path in sorted(files):
+        if not ((max_size > 0 and size > max_bytes) or (max_entries > 0 and count > max_entries)):
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= file_size
+        count -= 1
+        removed += 1
+
+    if removed:
+        logger.info("Removed {} integrals from incremental compilation cache".format(removed))
+
+    return removed
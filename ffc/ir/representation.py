@@ -17,7 +17,6 @@ function "foo", one should only need to use the data stored
 in the intermediate representation under the key "foo".
 """
 
-import itertools
 import logging
 from collections import namedtuple
 
@@ -27,6 +26,10 @@ import ffc.fiatinterface
 import FIAT.reference_element
 import ufl
 from ffc import classname
+from ffc.classname import (make_coordinate_mapping_jit_classname, make_dofmap_jit_classname,
+                           make_finite_element_jit_classname)
+from ffc.ir.ircache import cached_ir, integral_signature, load_integral
+from ffc.parallel import ordered_map
 from ffc.fiatinterface import (EnrichedElement, FlattenedDimensions,
                                MixedElement, QuadratureElement, SpaceOfReals,
                                create_element)
@@ -38,24 +41,6 @@ logger = logging.getLogger(__name__)
 ufc_integral_types = ("cell", "exterior_facet", "interior_facet", "vertex", "custom")
 
 
-def make_finite_element_jit_classname(ufl_element, tag, parameters):
-    assert isinstance(ufl_element, ufl.FiniteElementBase)
-    sig = classname.compute_signature([ufl_element], tag, parameters)
-    return classname.make_name("ffc_element_{}".format(sig), "finite_element", "main")
-
-
-def make_dofmap_jit_classname(ufl_element, tag, parameters):
-    assert isinstance(ufl_element, ufl.FiniteElementBase)
-    sig = classname.compute_signature([ufl_element], tag, parameters)
-    return classname.make_name("ffc_element_{}".format(sig), "dofmap", "main")
-
-
-def make_coordinate_mapping_jit_classname(ufl_element, tag, parameters):
-    assert isinstance(ufl_element, ufl.FiniteElementBase)
-    sig = classname.compute_signature([ufl_element], tag, parameters, coordinate_mapping=True)
-    return classname.make_name("ffc_coordinate_mapping_{}".format(sig), "coordinate_mapping", "main")
-
-
 def make_all_element_classnames(prefix, elements, coordinate_elements, parameters):
     # Make unique classnames to match separately jit-compiled
     # module
@@ -119,13 +104,29 @@ def compute_ir(analysis: namedtuple, prefix, parameters, jit=False):
         for e in coordinate_elements
     ]
 
-    # Compute and flatten representation of integrals
+    # Compute and flatten representation of integrals, which are
+    # independent and may be computed in parallel
     logger.info("Computing representation of integrals")
-    irs = [
-        _compute_integral_ir(fd, form_index, prefix, analysis.element_numbers, classnames, parameters)
-        for (form_index, fd) in enumerate(analysis.form_data)
-    ]
-    ir_integrals = list(itertools.chain(*irs))
+    tasks = [(itg_data, fd, form_index, prefix, analysis.element_numbers, classnames, parameters)
+             for (form_index, fd) in enumerate(analysis.form_data)
+             for itg_data in fd.integral_data]
+
+    # In incremental mode, reuse the representation and code of
+    # integrals which are unchanged since they were last compiled
+    signatures = [None] * len(tasks)
+    ir_integrals = [None] * len(tasks)
+    if parameters.get("incremental"):
+        for i, (itg_data, fd, form_index, *_) in enumerate(tasks):
+            signatures[i] = integral_signature(itg_data, fd, form_index, prefix, parameters)
+            ir_integrals[i] = load_integral(signatures[i], classnames, parameters)
+        logger.info("Reusing {} of {} integrals".format(len(tasks) - ir_integrals.count(None), len(tasks)))
+
+    missing = [i for i, ir in enumerate(ir_integrals) if ir is None]
+    computed = ordered_map(_compute_integral_ir, [tasks[i] for i in missing], parameters.get("ir_workers", 1))
+    for i, ir in zip(missing, computed):
+        if signatures[i] is not None:
+            ir["incremental_signature"] = signatures[i]
+        ir_integrals[i] = ir
 
     # Compute representation of forms
     logger.info("Computing representation of forms")
@@ -143,17 +144,25 @@ def compute_ir(analysis: namedtuple, prefix, parameters, jit=False):
 
 def _compute_element_ir(ufl_element, element_numbers, classnames, parameters):
     """Compute intermediate representation of element."""
+    ir = {"id": element_numbers[ufl_element]}
+    ir["classname"] = classnames["finite_element"][ufl_element]
+    ir.update(cached_ir("element", ufl_element, {"epsilon": parameters["epsilon"]}, parameters,
+                        lambda: _compute_element_data(ufl_element, parameters)))
+    ir["create_sub_element"] = [classnames["finite_element"][e] for e in ufl_element.sub_elements()]
+
+    return ir
+
+
+def _compute_element_data(ufl_element, parameters):
+    """Compute the part of the element representation which only
+    depends on the element."""
     # Create FIAT element
     fiat_element = create_element(ufl_element)
     cell = ufl_element.cell()
     cellname = cell.cellname()
 
-    # Store id
-    ir = {"id": element_numbers[ufl_element]}
-    ir["classname"] = classnames["finite_element"][ufl_element]
-
     # Compute data for each function
-    ir["signature"] = repr(ufl_element)
+    ir = {"signature": repr(ufl_element)}
     ir["cell_shape"] = cellname
     ir["topological_dimension"] = cell.topological_dimension()
     ir["geometric_dimension"] = cell.geometric_dimension()
@@ -168,7 +177,6 @@ def _compute_element_ir(ufl_element, element_numbers, classnames, parameters):
     ir["evaluate_dof"] = _evaluate_dof(ufl_element, fiat_element)
     ir["tabulate_dof_coordinates"] = _tabulate_dof_coordinates(ufl_element, fiat_element)
     ir["num_sub_elements"] = ufl_element.num_sub_elements()
-    ir["create_sub_element"] = [classnames["finite_element"][e] for e in ufl_element.sub_elements()]
 
     return ir
 
@@ -241,6 +249,18 @@ def _compute_dofmap_permutation_tables(fiat_element, cell):
 
 def _compute_dofmap_ir(ufl_element, element_numbers, classnames, parameters):
     """Compute intermediate representation of dofmap."""
+    ir = {"id": element_numbers[ufl_element]}
+    ir["classname"] = classnames["dofmap"][ufl_element]
+    ir.update(cached_ir("dofmap", ufl_element, {}, parameters,
+                        lambda: _compute_dofmap_data(ufl_element)))
+    ir["create_sub_dofmap"] = [classnames["dofmap"][e] for e in ufl_element.sub_elements()]
+
+    return ir
+
+
+def _compute_dofmap_data(ufl_element):
+    """Compute the part of the dofmap representation which only depends
+    on the element."""
     # Create FIAT element
     fiat_element = create_element(ufl_element)
     cell = ufl_element.cell()
@@ -255,12 +275,8 @@ def _compute_dofmap_ir(ufl_element, element_numbers, classnames, parameters):
     entity_closure_dofs, num_dofs_per_entity_closure = _tabulate_entity_closure_dofs(
         fiat_element, cell)
 
-    # Store id
-    ir = {"id": element_numbers[ufl_element]}
-    ir["classname"] = classnames["dofmap"][ufl_element]
-
     # Compute data for each function
-    ir["signature"] = "FFC dofmap for " + repr(ufl_element)
+    ir = {"signature": "FFC dofmap for " + repr(ufl_element)}
     ir["num_global_support_dofs"] = _num_global_support_dofs(fiat_element)
     ir["num_element_support_dofs"] = fiat_element.space_dimension() - ir["num_global_support_dofs"]
     ir["num_entity_dofs"] = num_dofs_per_entity
@@ -269,7 +285,6 @@ def _compute_dofmap_ir(ufl_element, element_numbers, classnames, parameters):
     ir["tabulate_entity_dofs"] = (entity_dofs, num_dofs_per_entity)
     ir["tabulate_entity_closure_dofs"] = (entity_closure_dofs, entity_dofs, num_dofs_per_entity)
     ir["num_sub_dofmaps"] = ufl_element.num_sub_elements()
-    ir["create_sub_dofmap"] = [classnames["dofmap"][e] for e in ufl_element.sub_elements()]
 
     return ir
 
@@ -332,6 +347,25 @@ def _compute_coordinate_mapping_ir(ufl_coordinate_element,
                                    classnames,
                                    parameters):
     """Compute intermediate representation of coordinate mapping."""
+    ir = {"id": element_numbers[ufl_coordinate_element]}
+    ir["classname"] = classnames["coordinate_mapping"][ufl_coordinate_element]
+    ir.update(cached_ir("coordinate_mapping", ufl_coordinate_element, {}, parameters,
+                        lambda: _compute_coordinate_mapping_data(ufl_coordinate_element)))
+
+    ir["create_coordinate_finite_element"] = classnames["finite_element"][ufl_coordinate_element]
+    ir["create_coordinate_dofmap"] = classnames["dofmap"][ufl_coordinate_element]
+
+    # Get classnames for coordinate element and its scalar subelement:
+    ir["coordinate_finite_element_classname"] = classnames["finite_element"][ufl_coordinate_element]
+    ir["scalar_coordinate_finite_element_classname"] = classnames["finite_element"][
+        ufl_coordinate_element.sub_elements()[0]]
+
+    return ir
+
+
+def _compute_coordinate_mapping_data(ufl_coordinate_element):
+    """Compute the part of the coordinate mapping representation which
+    only depends on the coordinate element."""
     cell = ufl_coordinate_element.cell()
     cellname = cell.cellname()
 
@@ -340,19 +374,12 @@ def _compute_coordinate_mapping_ir(ufl_coordinate_element,
     # Compute element values via fiat element
     tables = _tabulate_coordinate_mapping_basis(ufl_coordinate_element)
 
-    # Store id
-    ir = {"id": element_numbers[ufl_coordinate_element]}
-    ir["classname"] = classnames["coordinate_mapping"][ufl_coordinate_element]
-
     # Compute data for each function
-    ir["signature"] = "FFC coordinate_mapping from " + repr(ufl_coordinate_element)
+    ir = {"signature": "FFC coordinate_mapping from " + repr(ufl_coordinate_element)}
     ir["cell_shape"] = cellname
     ir["topological_dimension"] = cell.topological_dimension()
     ir["geometric_dimension"] = ufl_coordinate_element.value_size()
 
-    ir["create_coordinate_finite_element"] = classnames["finite_element"][ufl_coordinate_element]
-    ir["create_coordinate_dofmap"] = classnames["dofmap"][ufl_coordinate_element]
-
     ir["compute_physical_coordinates"] = None  # currently unused, corresponds to function name
     ir["compute_reference_coordinates"] = None  # currently unused, corresponds to function name
     ir["compute_jacobians"] = None  # currently unused, corresponds to function name
@@ -368,11 +395,6 @@ def _compute_coordinate_mapping_ir(ufl_coordinate_element,
     ir["coordinate_element_degree"] = ufl_coordinate_element.degree()
     ir["num_scalar_coordinate_element_dofs"] = tables["x0"].shape[0]
 
-    # Get classnames for coordinate element and its scalar subelement:
-    ir["coordinate_finite_element_classname"] = classnames["finite_element"][ufl_coordinate_element]
-    ir["scalar_coordinate_finite_element_classname"] = classnames["finite_element"][
-        ufl_coordinate_element.sub_elements()[0]]
-
     return ir
 
 
@@ -389,10 +411,8 @@ def _num_global_support_dofs(fiat_element):
     return num_reals
 
 
-def _compute_integral_ir(form_data, form_index, prefix, element_numbers, classnames, parameters):
-    """Compute intermediate represention for form integrals."""
-
-    irs = []
+def _compute_integral_ir(itg_data, form_data, form_index, prefix, element_numbers, classnames, parameters):
+    """Compute intermediate represention for a form integral."""
 
     # Select representation
     r = form_data.representation
@@ -403,37 +423,42 @@ def _compute_integral_ir(form_data, form_index, prefix, element_numbers, classna
     else:
         raise RuntimeError("Unknown representation: {}".format(r))
 
-    # Iterate over integrals
-    for itg_data in form_data.integral_data:
-
-        # Compute representation
-        ir = compute_integral_ir(
-            itg_data,
-            form_data,
-            form_index,  # FIXME: Can we remove this?
-            element_numbers,
-            classnames,
-            parameters)
-
-        # Build classname
-        ir["classname"] = classname.make_integral_name(prefix, itg_data.integral_type, form_index,
-                                                       itg_data.subdomain_id)
+    # Compute representation
+    ir = compute_integral_ir(
+        itg_data,
+        form_data,
+        form_index,  # FIXME: Can we remove this?
+        element_numbers,
+        classnames,
+        parameters)
 
-        ir["classnames"] = classnames  # FIXME XXX: Use this everywhere needed?
+    # Build classname
+    ir["classname"] = classname.make_integral_name(prefix, itg_data.integral_type, form_index,
+                                                   itg_data.subdomain_id)
 
-        # Storing prefix here for reconstruction of classnames on code
-        # generation side
-        ir["prefix"] = prefix  # FIXME: Drop this?
+    ir["classnames"] = classnames  # FIXME XXX: Use this everywhere needed?
 
-        # Store metadata for later reference (eg. printing as comment)
-        # NOTE: We make a commitment not to modify it!
-        ir["integrals_metadata"] = itg_data.metadata
-        ir["integral_metadata"] = [integral.metadata() for integral in itg_data.integrals]
-
-        # Append representation
-        irs.append(ir)
+    # Storing prefix here for reconstruction of classnames on code
+    # generation side
+    ir["prefix"] = prefix  # FIXME: Drop this?
+
+    # Store metadata for later reference (eg. printing as comment)
+    # NOTE: We make a commitment not to modify it!
+    ir["integrals_metadata"] = itg_data.metadata
+    ir["integral_metadata"] = [integral.metadata() for integral in itg_data.integrals]
+
+    # Compute representation of the action of a bilinear integral, for
+    # the integral of the same type and subdomain in the action form
+    action_form_data = getattr(form_data, "action_form_data", None)
+    if action_form_data is not None:
+        action_itg_data = [d for d in action_form_data.integral_data
+                           if (d.integral_type == itg_data.integral_type
+                               and d.subdomain_id == itg_data.subdomain_id)]
+        if action_itg_data:
+            ir["action"] = _compute_integral_ir(action_itg_data[0], action_form_data, form_index,
+                                                prefix, element_numbers, classnames, parameters)
 
-    return irs
+    return ir
 
 
 def _compute_form_ir(form_data, form_id, prefix, element_numbers, classnames, parameters):
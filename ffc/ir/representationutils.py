@@ -9,6 +9,7 @@ representations.
 
 """
 
+import hashlib
 import logging
 
 import numpy
@@ -17,9 +18,14 @@ import ufl
 from ffc import classname
 from ffc.fiatinterface import (create_element, create_quadrature, map_facet_points,
                                reference_cell_vertices)
+from ffc.lrucache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Quadrature points mapped to entities of the reference cell, shared by
+# all integrals compiled by this process
+_entity_points_cache = LRUCache(maxsize=1024)
+
 
 def create_quadrature_points_and_weights(integral_type, cell, degree, rule):
     """Create quadrature rule and return points and weights."""
@@ -56,7 +62,24 @@ def integral_type_to_entity_dim(integral_type, tdim):
 
 
 def map_integral_points(points, integral_type, cell, entity):
-    """Map points from reference entity to its parent reference cell."""
+    """Map points from reference entity to its parent reference cell.
+
+    The mapped points are cached, so the returned array is shared and
+    read-only.
+    """
+    points = numpy.ascontiguousarray(points, dtype=float)
+    key = (integral_type, cell.cellname(), entity, points.shape,
+           hashlib.sha1(points.tobytes()).hexdigest())
+    entity_points = _entity_points_cache.get(key)
+    if entity_points is None:
+        entity_points = numpy.array(_map_integral_points(points, integral_type, cell, entity),
+                                    dtype=float)
+        entity_points.setflags(write=False)
+        _entity_points_cache[key] = entity_points
+    return entity_points
+
+
+def _map_integral_points(points, integral_type, cell, entity):
     tdim = cell.topological_dimension()
     entity_dim = integral_type_to_entity_dim(integral_type, tdim)
     if entity_dim == tdim:
@@ -20,6 +20,7 @@ from ffc.ir.uflacs.analysis.modified_terminals import (analyse_modified_terminal
                                                        is_modified_terminal)
 from ffc.ir.uflacs.analysis.visualise import visualise
 from ffc.ir.uflacs.elementtables import (build_optimized_tables,
+                                         build_tensor_factor_tables,
                                          clamp_table_small_numbers,
                                          piecewise_ttypes)
 from ufl.checks import is_cellwise_constant
@@ -36,7 +37,8 @@ ma_data_t = collections.namedtuple("ma_data_t", ["ma_index", "tabledata"])
 
 block_data_t = collections.namedtuple("block_data_t",
                                       ["block_mode",
-                                       # "safe" | "full" | "preintegrated" | "premultiplied"
+                                       # "safe" | "full" | "partial" | "preintegrated" |
+                                       # "premultiplied" | "sumfactorized"
                                        "ttypes",  # list of table types for each block rank
                                        "factor_index",  # int: index of factor in vertex array
                                        "factor_is_piecewise",
@@ -47,8 +49,9 @@ block_data_t = collections.namedtuple("block_data_t",
                                        "transposed",  # block is the transpose of another
                                        "is_uniform",  # used in "preintegrated" and "premultiplied"
                                        "name",  # used in "preintegrated" and "premultiplied"
-                                       "ma_data",  # used in "full", "safe" and "partial"
-                                       "piecewise_ma_index"  # used in "partial"
+                                       "ma_data",  # used in "full", "safe", "partial" and "sumfactorized"
+                                       "piecewise_ma_index",  # used in "partial"
+                                       "tensor_factors"  # used in "sumfactorized"
                                        ])
 
 
@@ -160,6 +163,7 @@ def uflacs_default_parameters(optimize):
         "enable_preintegration": False,
         "enable_premultiplication": False,
         "enable_sum_factorization": False,
+        "enable_tensor_factorization": False,
         "enable_block_transpose_reuse": False,
         "enable_table_zero_compression": False,
 
@@ -169,6 +173,7 @@ def uflacs_default_parameters(optimize):
         "padlen": 1,
         "use_symbol_array": True,
         "tensor_init_mode": "upfront",  # interleaved | direct | upfront
+        "batch_size": 8,  # number of cells per simd loop in tabulate_tensor_batch
     }
     if optimize:
         # Override defaults if optimization is turned on
@@ -178,6 +183,7 @@ def uflacs_default_parameters(optimize):
             "enable_preintegration": True,
             "enable_premultiplication": False,
             "enable_sum_factorization": True,
+            "enable_tensor_factorization": False,
             "enable_block_transpose_reuse": True,
             "enable_table_zero_compression": True,
 
@@ -221,9 +227,28 @@ def parse_uflacs_optimization_parameters(parameters, integral_type):
     if integral_type in skip_premultiplied:
         p["enable_premultiplication"] = False
 
+    # Vectorized code needs aligned arrays with innermost dimensions
+    # padded to a whole number of SIMD registers of alignas bytes
+    if p["vectorize"]:
+        if not p["alignas"]:
+            p["alignas"] = 32
+        if p["padlen"] <= 1:
+            scalar_size = _scalar_sizes.get(parameters.get("scalar_type", "double"), 8)
+            p["padlen"] = max(1, p["alignas"] // scalar_size)
+
     return p
 
 
+# Size in bytes of the scalar types in generated code
+_scalar_sizes = {
+    "float": 4,
+    "double": 8,
+    "long double": 16,
+    "float complex": 8,
+    "double complex": 16,
+}
+
+
 def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                     quadrature_rules, parameters):
     # The intermediate representation dict we're building and returning
@@ -302,7 +327,8 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
             ir["unique_tables"],
             p["enable_table_zero_compression"],
             rtol=p["table_rtol"],
-            atol=p["table_atol"])
+            atol=p["table_atol"],
+            parameters=parameters)
 
         # If there are any 'zero' tables, replace symbolically and rebuild graph
         if 'zeros' in unique_table_types.values():
@@ -436,7 +462,25 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                 # quadloop
                 block_mode = "premultiplied"
             elif p["enable_sum_factorization"]:
-                if (rank == 2 and any(tt in piecewise_ttypes for tt in ttypes)):
+                # With enable_tensor_factorization, factor the tables of
+                # tensor product elements on quadrilaterals and
+                # hexahedra into one table per reference direction
+                tensor_factors = None
+                if (p["enable_tensor_factorization"] and integral_type == "cell" and rank > 0
+                        and not any(tt in piecewise_ttypes or tt == "quadrature" for tt in ttypes)):
+                    tensor_factors = [
+                        build_tensor_factor_tables(tr, F.nodes[ai]['mt'],
+                                                   quadrature_rules[num_points][0], cell,
+                                                   rtol=p["table_rtol"], atol=p["table_atol"])
+                        for tr, ai in zip(trs, ma_indices)]
+                    if any(factors is None for factors in tensor_factors):
+                        tensor_factors = None
+
+                if tensor_factors:
+                    # Store f*weight in each quadrature point in the
+                    # quadloop, integrate one direction at a time after
+                    block_mode = "sumfactorized"
+                elif (rank == 2 and any(tt in piecewise_ttypes for tt in ttypes)):
                     # Partial computation in quadloop of f*u[i], compute
                     # (f*u[i])*v[i] outside quadloop, (or with u,v
                     # swapped)
@@ -493,7 +537,7 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                 blockdata = block_data_t(
                     block_mode, ttypes, fi, factor_is_piecewise, block_unames,
                     block_restrictions, block_is_transposed, block_is_uniform, pname,
-                    None, None)
+                    None, None, None)
                 block_is_piecewise = True
 
             elif block_mode == "premultiplied":
@@ -531,7 +575,8 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                 block_unames = (pname, )
                 blockdata = block_data_t(
                     block_mode, ttypes, fi, factor_is_piecewise, block_unames,
-                    block_restrictions, block_is_transposed, block_is_uniform, pname, None, None)
+                    block_restrictions, block_is_transposed, block_is_uniform, pname, None, None,
+                    None)
                 block_is_piecewise = False
 
 
@@ -573,7 +618,7 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                     blockdata = block_data_t(block_mode, ttypes, fi,
                                              factor_is_piecewise, block_unames,
                                              block_restrictions, block_is_transposed,
-                                             None, None, tuple(ma_data), piecewise_ma_index)
+                                             None, None, tuple(ma_data), piecewise_ma_index, None)
                 elif block_mode in ("full", "safe"):
                     # Add to contributions:
                     # B[i] = sum_q weight * f * u[i] * v[j];  generated inside quadloop
@@ -583,7 +628,30 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                     blockdata = block_data_t(block_mode, ttypes, fi,
                                              factor_is_piecewise, block_unames,
                                              block_restrictions, block_is_transposed,
-                                             None, None, tuple(ma_data), None)
+                                             None, None, tuple(ma_data), None, None)
+
+            elif block_mode == "sumfactorized":
+                # Add to contributions:
+                # F[q] = weight * f;                     generated inside quadloop
+                # B[i,j] = sum_q F[q] * u[i,q] * v[j,q];  generated after quadloop,
+                #                                        summing over one direction at a time
+                # A[blockmap] += B[...];                 generated after quadloop
+                factor_unames = []
+                for tr, factors in zip(trs, tensor_factors):
+                    names = []
+                    for k, table in enumerate(factors):
+                        name = "{}_X{}".format(tr.name, k)
+                        unique_tables[name] = table
+                        unique_table_types[name] = "tensor_factor"
+                        names.append(name)
+                    factor_unames.append(tuple(names))
+
+                ma_data = tuple(ma_data_t(ma, tr) for ma, tr in zip(ma_indices, trs))
+                blockdata = block_data_t(block_mode, ttypes, fi,
+                                         factor_is_piecewise, unames,
+                                         block_restrictions, False,
+                                         None, None, ma_data, None, tuple(factor_unames))
+                block_is_piecewise = False
             else:
                 raise RuntimeError("Invalid block_mode %s" % (block_mode, ))
 
@@ -611,6 +679,9 @@ def build_uflacs_ir(cell, integral_type, entitytype, integrands, tensor_shape,
                 elif blockdata.block_mode in ("partial", "full", "safe"):
                     for mad in blockdata.ma_data:
                         active_table_names.add(mad.tabledata.name)
+                elif blockdata.block_mode == "sumfactorized":
+                    for names in blockdata.tensor_factors:
+                        active_table_names.update(names)
 
         # Record all table types before dropping tables
         ir["unique_table_types"].update(unique_table_types)
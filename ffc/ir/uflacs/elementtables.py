@@ -7,16 +7,22 @@
 """Tools for precomputed tables of terminal values."""
 
 import collections
+import functools
+import hashlib
+import itertools
 import logging
 
 import numpy
 
 import ufl
 import ufl.utils.derivativetuples
+from FIAT.tensor_product import FlattenedDimensions, TensorProductElement
 from ffc.fiatinterface import create_element
+from ffc.ir.ircache import cached_tabulation
 from ffc.ir.representationutils import (create_quadrature_points_and_weights,
                                         integral_type_to_entity_dim,
                                         map_integral_points)
+from ffc.lrucache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +31,7 @@ default_rtol = 1e-5
 default_atol = 1e-8
 
 table_origin_t = collections.namedtuple(
-    "table_origin", ["element", "avg", "derivatives", "flat_component", "dofrange", "dofmap"])
+    "table_origin_t", ["element", "avg", "derivatives", "flat_component", "dofrange", "dofmap"])
 
 piecewise_ttypes = ("piecewise", "fixed", "ones", "zeros")
 
@@ -34,9 +40,13 @@ uniform_ttypes = ("uniform", "fixed", "ones", "zeros")
 valid_ttypes = set(("quadrature", )) | set(piecewise_ttypes) | set(uniform_ttypes)
 
 unique_table_reference_t = collections.namedtuple(
-    "unique_table_reference",
+    "unique_table_reference_t",
     ["name", "values", "dofrange", "dofmap", "original_dim", "ttype", "is_piecewise", "is_uniform"])
 
+# FIAT tabulations by element, points, derivative order and entity,
+# shared by all integrals compiled by this process
+_tabulation_cache = LRUCache(maxsize=1024)
+
 
 # TODO: Get restriction postfix from somewhere central
 def ufc_restriction_offset(restriction, length):
@@ -122,8 +132,28 @@ def build_unique_tables(tables, rtol=default_rtol, atol=default_atol):
     return unique, mapping
 
 
+def _tabulate(ufl_element, deriv_order, points, integral_type, cell, entity, parameters):
+    """Return the FIAT tabulation of the element and its derivatives up
+    to deriv_order in the points mapped to the entity. The arrays are
+    shared between calls and must not be modified."""
+    points = numpy.ascontiguousarray(points, dtype=float)
+    key = (ufl_element, integral_type, entity, deriv_order, points.shape,
+           hashlib.sha1(points.tobytes()).hexdigest())
+    tabulation = _tabulation_cache.get(key)
+    if tabulation is None:
+        def tabulate():
+            entity_points = map_integral_points(points, integral_type, cell, entity)
+            return create_element(ufl_element).tabulate(deriv_order, entity_points)
+
+        tabulation = cached_tabulation(repr(key), parameters, tabulate)
+        for tbl in tabulation.values():
+            tbl.setflags(write=False)
+        _tabulation_cache[key] = tabulation
+    return tabulation
+
+
 def get_ffc_table_values(points, cell, integral_type, ufl_element, avg, entitytype,
-                         derivative_counts, flat_component):
+                         derivative_counts, flat_component, parameters=None):
     """Extract values from ffc element table.
 
     Returns a 3D numpy array with axes
@@ -158,14 +188,13 @@ def get_ffc_table_values(points, cell, integral_type, ufl_element, avg, entityty
                                                                ufl_element.degree(), "default")
 
     # Tabulate table of basis functions and derivatives in points for each entity
-    fiat_element = create_element(ufl_element)
     tdim = cell.topological_dimension()
     entity_dim = integral_type_to_entity_dim(integral_type, tdim)
     num_entities = ufl.cell.num_cell_entities[cell.cellname()][entity_dim]
     entity_tables = []
     for entity in range(num_entities):
-        entity_points = map_integral_points(points, integral_type, cell, entity)
-        tbl = fiat_element.tabulate(deriv_order, entity_points)[derivative_counts]
+        tbl = _tabulate(ufl_element, deriv_order, points, integral_type, cell, entity,
+                        parameters)[derivative_counts]
         entity_tables.append(tbl)
 
     # Extract arrays for the right scalar component
@@ -304,7 +333,8 @@ def build_element_tables(num_points,
                          entitytype,
                          modified_terminals,
                          rtol=default_rtol,
-                         atol=default_atol):
+                         atol=default_atol,
+                         parameters=None):
     """Build the element tables needed for a list of modified terminals.
 
     Input:
@@ -348,7 +378,7 @@ def build_element_tables(num_points,
         if name not in tables:
             tables[name] = get_ffc_table_values(quadrature_rules[num_points][0], cell,
                                                 integral_type, element, avg, entitytype,
-                                                local_derivatives, flat_component)
+                                                local_derivatives, flat_component, parameters)
 
             # Track table origin for custom integrals:
             table_origins[name] = res
@@ -547,7 +577,8 @@ def build_optimized_tables(num_points,
                            existing_tables,
                            compress_zeros,
                            rtol=default_rtol,
-                           atol=default_atol):
+                           atol=default_atol,
+                           parameters=None):
     # Build tables needed by all modified terminals
     tables, mt_table_names, table_origins = build_element_tables(
         num_points,
@@ -557,7 +588,8 @@ def build_optimized_tables(num_points,
         entitytype,
         modified_terminals,
         rtol=rtol,
-        atol=atol)
+        atol=atol,
+        parameters=parameters)
 
     # Optimize tables and get table name and dofrange for each modified terminal
     unique_tables, unique_table_origins, table_unames, table_ranges, table_dofmaps, table_original_num_dofs = \
@@ -642,3 +674,95 @@ def build_optimized_tables(num_points,
             ttype in piecewise_ttypes, ttype in uniform_ttypes)
 
     return unique_tables, unique_table_ttypes, unique_table_num_dofs, mt_unique_table_reference
+
+
+def _interval_factors(fiat_element):
+    """Return the interval elements of a FIAT tensor product element,
+    one for each reference direction, or None if it is not one."""
+    if isinstance(fiat_element, FlattenedDimensions):
+        return _interval_factors(fiat_element.element)
+    elif isinstance(fiat_element, TensorProductElement):
+        A = _interval_factors(fiat_element.A)
+        B = _interval_factors(fiat_element.B)
+        if A is None or B is None:
+            return None
+        return A + B
+    elif fiat_element.get_reference_element().get_spatial_dimension() == 1:
+        return [fiat_element]
+    else:
+        return None
+
+
+def _scalar_subelement(element, flat_component):
+    """Return the scalar subelement holding the reference value
+    component flat_component of element."""
+    while element.num_sub_elements():
+        for subelement in element.sub_elements():
+            size = ufl.product(subelement.reference_value_shape())
+            if flat_component < size:
+                element = subelement
+                break
+            flat_component -= size
+    if element.reference_value_shape() != ():
+        return None
+    return element
+
+
+def build_tensor_factor_tables(tr, mt, points, cell, rtol=default_rtol, atol=default_atol):
+    """Factor the table of a modified terminal on a quadrilateral or
+    hexahedron into one table per reference direction.
+
+    Returns a list with a 2D table with axes (point, dof) for each
+    direction k, such that the element table value in point
+    (q0, q1, ...) for dof (i0, i1, ...) is the product of the
+    direction tables at [qk, ik], with the multi-indices flattened last
+    index fastest. Returns None if the table is not of this form, e.g.
+    if the quadrature rule is not a tensor product or zero columns
+    have been stripped from the table.
+    """
+    if cell.cellname() not in ("quadrilateral", "hexahedron"):
+        return None
+    res = get_modified_terminal_element(mt)
+    if res is None:
+        return None
+    element, avg, local_derivatives, flat_component = res
+    if avg or mt.restriction:
+        return None
+
+    # Find the interval elements of the scalar element
+    element = _scalar_subelement(element, flat_component)
+    if element is None or element.mapping() != "identity":
+        return None
+    factors = _interval_factors(create_element(element))
+    tdim = cell.topological_dimension()
+    if factors is None or len(factors) != tdim:
+        return None
+
+    # Find the points along each direction of a tensor product rule
+    num_points = points.shape[0]
+    n = int(round(num_points**(1.0 / tdim)))
+    if n**tdim != num_points:
+        return None
+    grid = numpy.reshape(points, (n, ) * tdim + (tdim, ))
+    line_points = [grid[(0, ) * k + (slice(None), ) + (0, ) * (tdim - k - 1)][:, k]
+                   for k in range(tdim)]
+    if not numpy.allclose(points, list(itertools.product(*line_points))):
+        return None
+
+    # Tabulate the derivatives of the interval elements
+    tables = []
+    for k in range(tdim):
+        d = local_derivatives[k]
+        tbl = factors[k].tabulate(d, line_points[k].reshape(n, 1))[(d, )]
+        tables.append(clamp_table_small_numbers(numpy.transpose(tbl), rtol=rtol, atol=atol))
+
+    # Check the product of the direction tables against the table of
+    # all (contiguous, not stripped) dofs
+    product_table = functools.reduce(numpy.kron, tables)
+    num_dofs = product_table.shape[1]
+    if tuple(tr.dofmap) != tuple(range(tr.dofmap[0], tr.dofmap[0] + num_dofs)):
+        return None
+    if tr.values.shape[0] != 1 or not equal_tables(product_table, tr.values[0], rtol=rtol,
+                                                   atol=atol):
+        return None
+    return tables
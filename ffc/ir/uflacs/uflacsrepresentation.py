@@ -49,6 +49,11 @@ def compute_integral_ir(itg_data, form_data, form_id, element_numbers, classname
     else:
         ir["tensor_shape"] = argument_dimensions
 
+    # The diagonal of the element tensor is defined for bilinear forms
+    # with the same test and trial element
+    ir["has_diagonal"] = (len(argument_dimensions) == 2
+                          and form_data.argument_elements[0] == form_data.argument_elements[1])
+
     integral_type = itg_data.integral_type
     cell = itg_data.domain.ufl_cell()
 
@@ -102,12 +107,15 @@ def compute_integral_ir(itg_data, form_data, form_id, element_numbers, classname
     # Add coefficient numbering to IR
     ir["coefficient_numbering"] = coefficient_numbering
 
+    # The dofs of both cells are stored for each coefficient in
+    # interior facet integrals
+    num_cells = 2 if integral_type == "interior_facet" else 1
     index_to_coeff = sorted([(v, k) for k, v in coefficient_numbering.items()])
     offsets = {}
     _offset = 0
     for k, el in zip(index_to_coeff, form_data.coefficient_elements):
         offsets[k[1]] = _offset
-        _offset += ir["element_dimensions"][el]
+        _offset += num_cells * ir["element_dimensions"][el]
 
     # Copy offsets also into IR
     ir["coefficient_offsets"] = offsets
@@ -10,16 +10,16 @@ Parse command-line arguments and generate code from input UFL form files.
 """
 
 import argparse
+import concurrent.futures
 import cProfile
+import json
 import logging
 import pathlib
 import re
 import string
 
-import ufl
 from ffc import __version__ as FFC_VERSION
-from ffc import compiler, formatting
-from ffc.parameters import default_parameters
+from ffc.parameters import FFC_PARAMETERS, default_parameters, validate_parameters
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +67,35 @@ parser.add_argument(
     dest="u",
     metavar=("name", "value"),
     help="add new parameter to the parameter system")
+parser.add_argument(
+    "--jit-cache",
+    type=str,
+    metavar="DIR",
+    help="JIT compile all forms, elements and coordinate maps into cache directory DIR instead of generating code")
+parser.add_argument(
+    "--jit-parameters",
+    action="append",
+    default=[],
+    metavar="FILE",
+    help="JSON file with a set of JIT parameters to use with --jit-cache, may be repeated "
+    "(default: the parameters set with -f)")
+parser.add_argument(
+    "--incremental",
+    action='store_true',
+    help="reuse the code of integrals that are unchanged since the last compilation, "
+    "stored in the cache directory")
+parser.add_argument(
+    "--diagonal",
+    action='store_true',
+    help="generate tabulate_diagonal computing only the diagonal of the element tensors "
+    "of bilinear forms")
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    metavar="N",
+    help="compile up to N UFL files in parallel processes (default: %(default)s)")
 parser.add_argument("ufl_file", nargs='+', help="UFL file(s) to be compiled")
 
 
@@ -86,11 +115,33 @@ def main(args=None):
     parameters["quadrature_degree"] = xargs.quadrature_degree
     if xargs.output_directory:
         parameters["output_dir"] = xargs.output_directory
+    if xargs.incremental:
+        parameters["incremental"] = True
+    if xargs.diagonal:
+        parameters["tabulate_diagonal"] = True
     for p in xargs.f:
         assert len(p) == 2
         if p[0] not in parameters:
             raise RuntimeError("Command parameter set with -f does not exist in parameters system.")
         parameters[p[0]] = p[1]
+
+    if xargs.jit_cache:
+        # Fill the JIT cache with the parameters the application will
+        # use, typed as the application passes them, so that they give
+        # the same JIT signatures
+        overrides = {name: _cast_parameter(name, value) for name, value in xargs.f}
+        if xargs.jit_parameters:
+            parameter_sets = []
+            for filename in xargs.jit_parameters:
+                with open(filename) as f:
+                    parameter_sets.append(dict(json.load(f), **overrides))
+        else:
+            parameter_sets = [overrides]
+        for i, jit_parameters in enumerate(parameter_sets):
+            _check_jit_parameters(jit_parameters)
+            jit_parameters["cache_dir"] = xargs.jit_cache
+            parameter_sets[i] = validate_parameters(jit_parameters)
+        return _prewarm_cache(xargs.ufl_file, parameter_sets, int(parameters["jit_workers"]))
     for p in xargs.u:
         assert len(p) == 2
         if p[0] in parameters:
@@ -103,58 +154,219 @@ def main(args=None):
     # ufl.constantvalue.precision = int(parameters["precision"])
 
     # Call parser and compiler for each file
-    resultcode = _compile_files(xargs.ufl_file, parameters, xargs.profile)
+    resultcode = _compile_files(xargs.ufl_file, parameters, xargs.profile, xargs.jobs)
     return resultcode
 
 
-def _compile_files(args, parameters, enable_profile):
-    # Call parser and compiler for each file
+def _cast_parameter(name, value):
+    """Cast a parameter value given on the command line to the type of
+    its default value."""
+    default = FFC_PARAMETERS[name]
+    if isinstance(default, bool):
+        return value.lower() in ["1", "true", "yes"]
+    elif isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+
+def _check_jit_parameters(parameters):
+    """Check that all parameters of a set of JIT parameters exist."""
+    from ffc.ir.uflacs.build_uflacs_ir import uflacs_default_parameters
+    known = set(FFC_PARAMETERS) | set(uflacs_default_parameters(optimize=True))
+    unknown = sorted(set(parameters) - known)
+    if unknown:
+        raise RuntimeError("JIT parameters {} do not exist in parameters system.".format(", ".join(unknown)))
+
+
+# Parameters of work done inside a process pool, which must not start
+# pools of its own
+_serial_parameters = {"jit_workers": 1, "ir_workers": 1, "codegen_workers": 1}
+
+
+def _compile_files(args, parameters, enable_profile, jobs=1):
     for filename in args:
-        file = pathlib.Path(filename)
-        if file.suffix != ".ufl":
+        if pathlib.Path(filename).suffix != ".ufl":
             logger.error("Expecting a UFL form file (.ufl).")
             return 1
 
-        # Remove weird characters (file system allows more than the C
-        # preprocessor)
-        prefix = file.stem
-        prefix = re.subn("[^{}]".format(string.ascii_letters + string.digits + "_"), "!", prefix)[0]
-        prefix = re.subn("!+", "_", prefix)[0]
+    jobs = min(jobs, len(args))
+    if jobs <= 1:
+        # Call parser and compiler for each file, a failing file sets
+        # the exit status without stopping the others
+        resultcode = 0
+        for filename in args:
+            try:
+                profile_file = _compile_file(filename, parameters, enable_profile)
+            except Exception:
+                logger.exception("Compiling {} failed".format(filename))
+                resultcode = 1
+                continue
+            if profile_file:
+                print("Wrote profiling info to file {0}".format(profile_file))
+        return resultcode
+
+    # Files are compiled in worker processes, their log records are
+    # replayed here in the order of the files. Each worker compiles its
+    # file serially, to not start pools inside the pool.
+    resultcode = 0
+    log_level = logging.getLogger("ffc").getEffectiveLevel()
+    parameters = dict(parameters, **_serial_parameters)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_compile_file_in_worker, filename, parameters, enable_profile, log_level)
+                   for filename in args]
+        for future in futures:
+            status, records, profile_file = future.result()
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if profile_file:
+                print("Wrote profiling info to file {0}".format(profile_file))
+            resultcode = max(resultcode, status)
+
+    return resultcode
+
+
+def _compile_file(filename, parameters, enable_profile):
+    """Generate code for a UFL file. Return the name of the profiling
+    file written if profiling is enabled."""
+    # The compiler is imported on first use, to keep `import ffc` cheap
+    import ufl
+    from ffc import compiler, formatting
+
+    file = pathlib.Path(filename)
+
+    # Remove weird characters (file system allows more than the C
+    # preprocessor)
+    prefix = file.stem
+    prefix = re.subn("[^{}]".format(string.ascii_letters + string.digits + "_"), "!", prefix)[0]
+    prefix = re.subn("!+", "_", prefix)[0]
 
-        # Turn on profiling
-        if enable_profile:
-            pr = cProfile.Profile()
-            pr.enable()
+    # Turn on profiling
+    if enable_profile:
+        pr = cProfile.Profile()
+        pr.enable()
 
-        # Load UFL file
+    # Load UFL file
+    ufd = ufl.algorithms.load_ufl_file(filename)
+
+    # Generate code
+    if len(ufd.forms) > 0:
+        code_h, code_c = compiler.compile_ufl_objects(
+            ufd.forms, ufd.object_names, prefix=prefix, parameters=parameters)
+    else:
+        code_h, code_c = compiler.compile_ufl_objects(
+            ufd.elements, ufd.object_names, prefix=prefix, parameters=parameters)
+
+    # Write to file
+    formatting.write_code(code_h, code_c, prefix, parameters)
+
+    # except Exception as exception:
+    #    # Catch exceptions only when not in debug mode
+    #    if parameters["log_level"] <= DEBUG:
+    #        raise
+    #    else:
+    #        print("")
+    #        print_error(str(exception))
+    #        print_error("To get more information about this error, rerun FFC with --debug.")
+    #        return 1
+
+    # Turn off profiling and write status to file
+    if enable_profile:
+        pr.disable()
+        pfn = "ffc_{0}.profile".format(prefix)
+        pr.dump_stats(pfn)
+        return pfn
+
+    return None
+
+
+class _RecordCollector(logging.Handler):
+    """Logging handler keeping picklable copies of the records it handles."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Format messages and tracebacks here, their arguments may not
+        # be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _compile_file_in_worker(filename, parameters, enable_profile, log_level):
+    """Compile a UFL file in a worker process, return the exit status,
+    the log records and the name of the profiling file."""
+    ffc_logger = logging.getLogger("ffc")
+    ffc_logger.setLevel(log_level)
+    collector = _RecordCollector()
+    ffc_logger.addHandler(collector)
+    ffc_logger.propagate = False
+    status, profile_file = 0, None
+    try:
+        profile_file = _compile_file(filename, parameters, enable_profile)
+    except Exception:
+        logger.exception("Compiling {} failed".format(filename))
+        status = 1
+    finally:
+        ffc_logger.removeHandler(collector)
+        ffc_logger.propagate = True
+
+    return status, collector.records, profile_file
+
+
+def _prewarm_cache(filenames, parameter_sets, workers):
+    """JIT compile every form, element and coordinate map in the UFL
+    files, once for each set of parameters"""
+    import ufl
+    from ffc.codegeneration import jitcache
+
+    tasks = []
+    for filename in filenames:
+        if pathlib.Path(filename).suffix != ".ufl":
+            logger.error("Expecting a UFL form file (.ufl).")
+            return 1
         ufd = ufl.algorithms.load_ufl_file(filename)
 
-        # Generate code
-        if len(ufd.forms) > 0:
-            code_h, code_c = compiler.compile_ufl_objects(
-                ufd.forms, ufd.object_names, prefix=prefix, parameters=parameters)
-        else:
-            code_h, code_c = compiler.compile_ufl_objects(
-                ufd.elements, ufd.object_names, prefix=prefix, parameters=parameters)
-
-        # Write to file
-        formatting.write_code(code_h, code_c, prefix, parameters)
-
-        # except Exception as exception:
-        #    # Catch exceptions only when not in debug mode
-        #    if parameters["log_level"] <= DEBUG:
-        #        raise
-        #    else:
-        #        print("")
-        #        print_error(str(exception))
-        #        print_error("To get more information about this error, rerun FFC with --debug.")
-        #        return 1
-
-        # Turn off profiling and write status to file
-        if enable_profile:
-            pr.disable()
-            pfn = "ffc_{0}.profile".format(prefix)
-            pr.dump_stats(pfn)
-            print("Wrote profiling info to file {0}".format(pfn))
+        coordinate_elements = []
+        for form in ufd.forms:
+            element = form.ufl_domain().ufl_coordinate_element()
+            if element not in coordinate_elements:
+                coordinate_elements.append(element)
+
+        for parameters in parameter_sets:
+            tasks += [("forms", form, parameters) for form in ufd.forms]
+            tasks += [("elements", element, parameters) for element in ufd.elements]
+            tasks += [("coordinate_maps", ufl.Mesh(element), parameters) for element in coordinate_elements]
+
+    logger.info("Prewarming JIT cache with {} objects".format(len(tasks)))
+    misses = jitcache.statistics(pathlib.Path(parameter_sets[0]["cache_dir"]).expanduser())["misses"]
+
+    # Objects are independent, dependencies shared between them are
+    # built once thanks to the cache locks. Each worker compiles its
+    # object serially, to not start pools inside the pool.
+    if workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_jit_compile, kind, ufl_object, dict(parameters, **_serial_parameters))
+                       for kind, ufl_object, parameters in tasks]
+            for future in futures:
+                future.result()
+    else:
+        for task in tasks:
+            _jit_compile(*task)
+
+    cache_dir = pathlib.Path(parameter_sets[0]["cache_dir"]).expanduser()
+    stats = jitcache.statistics(cache_dir)
+    print("JIT cache {} holds {} modules ({:.1f} MB), {} built now".format(
+        cache_dir, stats["entries"], stats["bytes"] / (1024 * 1024), stats["misses"] - misses))
 
     return 0
+
+
+def _jit_compile(kind, ufl_object, parameters):
+    from ffc.codegeneration import jit
+    compile_objects = getattr(jit, "compile_" + kind)
+    compile_objects([ufl_object], parameters=parameters)
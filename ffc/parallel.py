@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Helpers for running independent compiler tasks in a process pool."""
+
+import concurrent.futures
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def ordered_map(function, args, workers):
+    """Return [function(*a) for a in args], computed by up to workers
+    processes. Results are returned in the order of args, so the outcome
+    does not depend on the number of workers. Arguments and results must
+    be picklable."""
+    args = list(args)
+    workers = min(workers, len(args))
+    if workers <= 1:
+        return [function(*a) for a in args]
+
+    logger.info("Running {} tasks on {} processes".format(len(args), workers))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(function, *a) for a in args]
+        return [future.result() for future in futures]
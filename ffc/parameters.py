@@ -12,7 +12,7 @@ import os
 logger = logging.getLogger(__name__)
 
 # NB! Parameters in the generate and build sets are
-# included in jit signature, cache and log are not.
+# included in jit signature, cache, parallel and log are not.
 _FFC_GENERATE_PARAMETERS = {
     "format": "ufc",  # code generation format
     "representation": "auto",  # form representation / code generation strategy
@@ -31,12 +31,26 @@ _FFC_GENERATE_PARAMETERS = {
     # C double precision floating-point types)
     "scalar_type": "double",
     # Max time to wait on cache if not building on this
-    # process (seconds)
+    # process (seconds), only used on platforms without fcntl
     "timeout": 10,
     # ':' separated list of include filenames to add to generated code
     "external_includes": "",
     # Whether to crosslink JIT libraries or build standalone
     "crosslink": True,
+    # generate tabulate_tensor_batch computing the element tensors
+    # of many cells in one call
+    "tabulate_tensor_batch": False,
+    # generate tabulate_action in integrals of bilinear forms,
+    # computing the action on a vector of trial function dofs
+    # without forming the element matrix
+    "tabulate_action": False,
+    # generate tabulate_diagonal in integrals of bilinear forms with
+    # the same test and trial element, computing only the diagonal
+    # of the element tensor (uflacs representation only)
+    "tabulate_diagonal": False,
+    # generate omp simd loops over aligned arrays padded to the SIMD
+    # width in tabulate_tensor (uflacs representation only)
+    "vectorize": False,
 }
 _FFC_BUILD_PARAMETERS = {
     "cpp_optimize": True,  # optimization for the C++ compiler
@@ -51,6 +65,27 @@ _FFC_BUILD_PARAMETERS = {
 _FFC_CACHE_PARAMETERS = {
     "cache_dir": "~/.cache/fenics",  # cache dir used by default
     "output_dir": ".",  # output directory for generated code
+    # max size of the JIT cache in MB before least recently used
+    # modules are evicted, 0 for no limit
+    "cache_max_size": 0,
+    # max number of modules in the JIT cache, 0 for no limit
+    "cache_max_entries": 0,
+    # cache element, dofmap and coordinate mapping representations
+    # in cache_dir between compilations
+    "ir_cache": False,
+    # reuse representation and code of integrals which are unchanged
+    # since they were last compiled with the same cache_dir
+    "incremental": False,
+    # max number of FIAT elements kept in memory, 0 for no limit
+    "element_cache_size": 256,
+}
+_FFC_PARALLEL_PARAMETERS = {
+    # max number of processes used to build JIT dependencies
+    "jit_workers": 1,
+    # max number of processes used to compute integral representations
+    "ir_workers": 1,
+    # max number of processes used to generate code
+    "codegen_workers": 1,
 }
 _FFC_LOG_PARAMETERS = {
     # "log_level": INFO + 5,  # log level, displaying only messages with level >= log_level
@@ -60,6 +95,7 @@ _FFC_LOG_PARAMETERS = {
 FFC_PARAMETERS = {}
 FFC_PARAMETERS.update(_FFC_BUILD_PARAMETERS)
 FFC_PARAMETERS.update(_FFC_CACHE_PARAMETERS)
+FFC_PARAMETERS.update(_FFC_PARALLEL_PARAMETERS)
 FFC_PARAMETERS.update(_FFC_LOG_PARAMETERS)
 FFC_PARAMETERS.update(_FFC_GENERATE_PARAMETERS)
 
@@ -138,6 +174,27 @@ def _validate_parameters(parameters):
                 parameters.get("precision")))
             raise
 
+    # Cast flags given on the command line from str to bool
+    for k in ["tabulate_tensor_batch", "tabulate_action", "tabulate_diagonal", "vectorize"]:
+        if isinstance(parameters[k], str):
+            parameters[k] = parameters[k].lower() in ["1", "true", "yes"]
+
+    # Cast cache limits from str to int
+    for k in ["cache_max_size", "cache_max_entries", "element_cache_size"]:
+        try:
+            parameters[k] = int(parameters[k])
+        except Exception:
+            logger.exception("Failed to convert {} '{}' to int".format(k, parameters.get(k)))
+            raise
+
+    # Cast number of worker processes from str to int
+    for k in _FFC_PARALLEL_PARAMETERS:
+        try:
+            parameters[k] = max(1, int(parameters[k]))
+        except Exception:
+            logger.exception("Failed to convert {} '{}' to int".format(k, parameters.get(k)))
+            raise
+
 
 def compilation_relevant_parameters(parameters):
     p = parameters.copy()
@@ -145,6 +202,8 @@ def compilation_relevant_parameters(parameters):
         del p[k]
     for k in _FFC_CACHE_PARAMETERS:
         del p[k]
+    for k in _FFC_PARALLEL_PARAMETERS:
+        del p[k]
 
     # This doesn't work because some parameters may not be among the defaults above.
     # That is somewhat confusing but we'll just have to live with it at least for now.
@@ -26,7 +26,8 @@ else:
 
 URL = "https://bitbucket.org/fenics-project/ffc/"
 
-ENTRY_POINTS = {'console_scripts': ['ffc = ffc.__main__:main', 'ffc-3 = ffc.__main__:main']}
+ENTRY_POINTS = {'console_scripts': ['ffc = ffc.__main__:main', 'ffc-3 = ffc.__main__:main',
+                                    'ffc-cache = ffc.codegeneration.jitcache:main']}
 
 AUTHORS = """\
 Anders Logg, Kristian Oelgaard, Marie Rognes, Garth N. Wells,
@@ -22,6 +22,9 @@
 # Modified by Lizao Li, 2016
 
 
+import subprocess
+import sys
+
 import pytest
 import numpy
 
@@ -191,3 +194,68 @@ supported (non-mixed) for low degrees"""
                 else:
                     for k in range(element.value_shape()[0]):
                         assert round(basis[i][k][0] - reference[i](x)[k], 10) == 0.0
+
+
+def test_element_cache(tmpdir):
+    "Test reuse of elements from the element cache, in memory and on disk."
+    from ffc import fiatinterface
+    elements = [FiniteElement("Lagrange", "triangle", degree) for degree in range(1, 4)]
+    try:
+        fiatinterface.configure_element_cache({"element_cache_size": 2, "ir_cache": True,
+                                               "cache_dir": str(tmpdir)})
+        fiatinterface._cache.clear()
+        for element in elements:
+            create_element(element)
+        create_element(elements[2])
+        stats = fiatinterface.element_cache_statistics()
+        assert stats["hits"] == 1 and stats["misses"] == 3
+        assert stats["size"] == 2
+
+        # The evicted P1 element is loaded from disk
+        P1 = create_element(elements[0])
+        assert P1.space_dimension() == 3
+        assert fiatinterface.element_cache_statistics()["misses"] == 4
+        assert len(tmpdir.listdir()[0].listdir()) == 3
+        points = [random_point(element_coords("triangle")) for i in range(3)]
+        assert numpy.allclose(P1.tabulate(1, points)[(1, 0)],
+                              fiatinterface._create_element(elements[0]).tabulate(1, points)[(1, 0)])
+    finally:
+        fiatinterface.configure_element_cache({"element_cache_size": 256})
+
+
+def test_element_pickling_registered_lazily(tmpdir):
+    "Test that FIAT pickling is only changed once the disk cache is enabled."
+    code = """if True:
+        import copyreg
+        from FIAT.expansions import TriangleExpansionSet
+        from ffc import fiatinterface
+        assert TriangleExpansionSet not in copyreg.dispatch_table
+        fiatinterface.configure_element_cache({"ir_cache": False})
+        assert TriangleExpansionSet not in copyreg.dispatch_table
+        fiatinterface.configure_element_cache({"ir_cache": True, "cache_dir": %r})
+        assert TriangleExpansionSet in copyreg.dispatch_table
+        """ % str(tmpdir)
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_quadrature_cache(tmpdir):
+    "Test reuse of quadrature rules from the quadrature cache, in memory and on disk."
+    from ffc import fiatinterface
+    try:
+        fiatinterface.configure_element_cache({"element_cache_size": 256, "ir_cache": True,
+                                               "cache_dir": str(tmpdir)})
+        fiatinterface._quadrature_cache.clear()
+        points, weights = fiatinterface.create_quadrature("tetrahedron", 6)
+        assert fiatinterface.create_quadrature("tetrahedron", 6)[0] is points
+        assert not points.flags.writeable and not weights.flags.writeable
+        assert fiatinterface._quadrature_cache.hits == 1
+
+        # A new process finds the rule on disk
+        fiatinterface._quadrature_cache.clear()
+        cached_points, cached_weights = fiatinterface.create_quadrature("tetrahedron", 6)
+        assert len(tmpdir.listdir()[0].listdir()) == 1
+        assert numpy.array_equal(cached_points, points)
+        assert numpy.array_equal(cached_weights, weights)
+        assert not cached_points.flags.writeable
+    finally:
+        fiatinterface.configure_element_cache({"element_cache_size": 256})
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import numpy
+
+import ufl
+from ffc.fiatinterface import create_element
+from ffc.ir.ircache import IR_CACHE_DIR
+from ffc.ir.representationutils import create_quadrature_points_and_weights, map_integral_points
+from ffc.ir.uflacs import elementtables
+
+
+def test_cached_tabulation(tmpdir):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 3)
+    points, _ = create_quadrature_points_and_weights("exterior_facet", ufl.triangle, 4, "default")
+    parameters = {"cache_dir": str(tmpdir), "ir_cache": True}
+    elementtables._tabulation_cache.clear()
+
+    table = elementtables.get_ffc_table_values(points, ufl.triangle, "exterior_facet", element, None,
+                                               "facet", (1, 0), None, parameters)
+    assert elementtables._tabulation_cache.misses == 3
+    assert len(tmpdir.join(IR_CACHE_DIR).listdir()) == 3
+
+    # Other derivatives of the same tabulation are found in memory
+    elementtables.get_ffc_table_values(points, ufl.triangle, "exterior_facet", element, None,
+                                       "facet", (0, 1), None, parameters)
+    assert elementtables._tabulation_cache.hits == 3
+
+    # A new process finds the tabulations on disk
+    elementtables._tabulation_cache.clear()
+    cached = elementtables.get_ffc_table_values(points, ufl.triangle, "exterior_facet", element, None,
+                                                "facet", (1, 0), None, parameters)
+    assert len(tmpdir.join(IR_CACHE_DIR).listdir()) == 3
+    assert numpy.array_equal(cached, table)
+
+    # Compare with direct tabulation on the second facet
+    facet_points = map_integral_points(points, "exterior_facet", ufl.triangle, 1)
+    reference = create_element(element).tabulate(1, facet_points)[(1, 0)]
+    assert numpy.allclose(table[1], reference.T)
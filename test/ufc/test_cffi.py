@@ -8,8 +8,11 @@
 import numpy as np
 import pytest
 import cffi
+import re
 
 import ffc.codegeneration.jit
+import ffc.compiler
+import ffc.parameters
 import ufl
 
 
@@ -288,6 +291,297 @@ def test_form_coefficient():
     assert np.isclose(A_diff.min(), 0.0)
 
 
+def test_tabulate_tensor_batch():
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = (g * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + g * u * v * ufl.ds
+         + g('+') * ufl.jump(u) * ufl.jump(v) * ufl.dS)
+    parameters = {'tabulate_tensor_batch': True, 'vectorize': True}
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    form0 = compiled_forms[0][0]
+    ffi = module.ffi
+
+    def ptr(x, c_type='double'):
+        return ffi.cast('{} *'.format(c_type), x.ctypes.data)
+
+    # Not a multiple of the number of cells per simd loop
+    num_cells = 11
+    np.random.seed(1)
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0]) + 0.2 * np.random.rand(num_cells, 6)
+    w = np.random.rand(num_cells, 6)
+    facets = np.arange(num_cells, dtype=np.int32) % 3
+    orientations = np.zeros(num_cells, dtype=np.int32)
+
+    # Batch arguments are interleaved with the cell index fastest
+    coords_b = np.ascontiguousarray(coords.T)
+    w_b = np.ascontiguousarray(w.T)
+
+    cell_integral = form0.create_cell_integral(-1)
+    A_b = np.zeros((36, num_cells))
+    cell_integral.tabulate_tensor_batch(ptr(A_b), ptr(w_b), ptr(coords_b), num_cells,
+                                        ptr(orientations, 'int'))
+    for c in range(num_cells):
+        A = np.zeros(36)
+        cell_integral.tabulate_tensor(ptr(A), ptr(w[c]), ptr(coords[c]), 0)
+        assert np.allclose(A, A_b[:, c])
+
+    facet_integral = form0.create_exterior_facet_integral(-1)
+    A_b = np.zeros((36, num_cells))
+    facet_integral.tabulate_tensor_batch(ptr(A_b), ptr(w_b), ptr(coords_b), num_cells,
+                                         ptr(facets, 'int'), ptr(orientations, 'int'))
+    for c in range(num_cells):
+        A = np.zeros(36)
+        facet_integral.tabulate_tensor(ptr(A), ptr(w[c]), ptr(coords[c]), int(facets[c]), 0)
+        assert np.allclose(A, A_b[:, c])
+
+    # Interior facets hold the coefficient dofs of both cells
+    coords1 = coords[::-1] + 1.0
+    w = np.random.rand(num_cells, 12)
+    facets1 = facets[::-1].copy()
+    coords1_b = np.ascontiguousarray(coords1.T)
+    w_b = np.ascontiguousarray(w.T)
+    interior_integral = form0.create_interior_facet_integral(-1)
+    A_b = np.zeros((144, num_cells))
+    interior_integral.tabulate_tensor_batch(ptr(A_b), ptr(w_b), ptr(coords_b), ptr(coords1_b), num_cells,
+                                            ptr(facets, 'int'), ptr(facets1, 'int'),
+                                            ptr(orientations, 'int'), ptr(orientations, 'int'))
+    for c in range(num_cells):
+        A = np.zeros(144)
+        interior_integral.tabulate_tensor(ptr(A), ptr(w[c]), ptr(coords[c]), ptr(coords1[c]),
+                                          int(facets[c]), int(facets1[c]), 0, 0)
+        assert np.allclose(A, A_b[:, c])
+
+    # The loops over cells are innermost simd loops, with the loops
+    # over quadrature points and dofs outside them
+    code_h, code_c = ffc.compiler.compile_ufl_objects([a], prefix="batch", parameters=parameters)
+    batch_code = re.findall(r"^void tabulate_tensor_batch_batch_[^;{]*{.*?^}", code_c, re.M | re.S)
+    assert len(batch_code) == 3
+    lines = [line.strip() for line in "\n".join(batch_code).split("\n")]
+    assert len([line for line in lines if line.startswith("for (int kb = 0;")]) == 3
+    cell_loops = [i for i, line in enumerate(lines) if line.startswith("for (int ib = ib0; ib < ib1; ++ib)")]
+    assert cell_loops
+    assert all(lines[i - 1] == "#pragma omp simd" for i in cell_loops)
+    assert all(lines[i + 1] == "for (int ib = ib0; ib < ib1; ++ib)"
+               for i, line in enumerate(lines) if line.startswith("#pragma omp simd"))
+    for i in cell_loops:
+        body = [lines[i + 1]]
+        if body[0] == "{":
+            depth = 1
+            for line in lines[i + 2:]:
+                depth += line.count("{") - line.count("}")
+                if depth == 0:
+                    break
+                body.append(line)
+        assert not any(line.startswith("for (") for line in body)
+
+    # Not generated unless asked for
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a])
+    assert compiled_forms[0][0].create_cell_integral(-1).tabulate_tensor_batch == ffi.NULL
+
+
+def test_tabulate_action():
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = (g * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + g * u * v * ufl.ds
+         + g('+') * ufl.jump(u) * ufl.jump(v) * ufl.dS)
+    L = g * v * ufl.dx
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms(
+        [a, L], parameters={'tabulate_action': True})
+    form0 = compiled_forms[0][0]
+    ffi = module.ffi
+
+    def ptr(x):
+        return ffi.cast('double *', x.ctypes.data)
+
+    # Action of the element matrix on x, with the dofs of x following
+    # the coefficients
+    w = np.linspace(1.0, 2.0, 12)
+    x = np.linspace(-1.0, 1.0, 12)
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.1, 1.2])
+    for integral, args in [(form0.create_cell_integral(-1), (ptr(coords), 0)),
+                           (form0.create_exterior_facet_integral(-1), (ptr(coords), 1, 0))]:
+        A = np.zeros((6, 6))
+        integral.tabulate_tensor(ptr(A), ptr(w), *args)
+        y = np.zeros(6)
+        integral.tabulate_action(ptr(y), ptr(np.concatenate((w[:6], x[:6]))), *args)
+        assert np.allclose(y, A.dot(x[:6]))
+
+    # Interior facets hold the dofs of both cells for each coefficient
+    coords1 = np.array([1.0, 0.0, 0.1, 1.2, 1.2, 1.1])
+    integral = form0.create_interior_facet_integral(-1)
+    A = np.zeros((12, 12))
+    integral.tabulate_tensor(ptr(A), ptr(w), ptr(coords), ptr(coords1), 0, 2, 0, 0)
+    y = np.zeros(12)
+    integral.tabulate_action(ptr(y), ptr(np.concatenate((w, x))), ptr(coords), ptr(coords1),
+                             0, 2, 0, 0)
+    assert np.allclose(y, A.dot(x))
+
+    # Only generated for bilinear forms
+    assert compiled_forms[1][0].create_cell_integral(-1).tabulate_action == ffi.NULL
+
+
+hexahedron_coords = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 1.1, 1.0, 0.0,
+                     0.0, 0.0, 1.0, 1.0, 0.1, 1.0, 0.0, 1.0, 1.2, 1.0, 1.0, 1.1]
+
+
+@pytest.mark.parametrize("cell,coords,enable_tensor_factorization", [
+    (ufl.triangle, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2], False),
+    (ufl.hexahedron, hexahedron_coords, False),
+    (ufl.hexahedron, hexahedron_coords, True),
+])
+def test_tabulate_diagonal(cell, coords, enable_tensor_factorization):
+    family = "Lagrange" if cell == ufl.triangle else "Q"
+    element = ufl.MixedElement([ufl.VectorElement(family, cell, 2), ufl.FiniteElement(family, cell, 1)])
+    (u, p), (v, q) = ufl.TrialFunctions(element), ufl.TestFunctions(element)
+    g = ufl.Coefficient(ufl.FiniteElement(family, cell, 1))
+    a = (g * ufl.inner(ufl.grad(u), ufl.grad(v)) + u[0].dx(1) * v[1].dx(0) + ufl.div(u) * q
+         + p * q) * ufl.dx + g * ufl.inner(u, v) * ufl.ds
+    parameters = {'tabulate_diagonal': True, 'enable_tensor_factorization': enable_tensor_factorization}
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    form0 = compiled_forms[0][0]
+    ffi = module.ffi
+
+    def ptr(x):
+        return ffi.cast('double *', x.ctypes.data)
+
+    n = form0.create_finite_element(0).space_dimension
+    w = np.linspace(1.0, 2.0, 8)
+    x = np.array(coords)
+    for integral, args in [(form0.create_cell_integral(-1), (0, )),
+                           (form0.create_exterior_facet_integral(-1), (1, 0))]:
+        A = np.zeros((n, n))
+        integral.tabulate_tensor(ptr(A), ptr(w), ptr(x), *args)
+        d = np.zeros(n)
+        integral.tabulate_diagonal(ptr(d), ptr(w), ptr(x), *args)
+        assert np.allclose(d, np.diag(A))
+
+    # Not generated unless asked for
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a])
+    assert compiled_forms[0][0].create_cell_integral(-1).tabulate_diagonal == ffi.NULL
+
+
+@pytest.mark.parametrize("cell,coords", [
+    (ufl.triangle, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2]),
+    (ufl.quadrilateral, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2, 1.3, 1.1]),
+])
+def test_vectorize(cell, coords):
+    element = ufl.FiniteElement("Lagrange", cell, 3)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = g * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + g * u * v * ufl.dx
+
+    results = []
+    for vectorize in (False, True):
+        compiled_forms, module = ffc.codegeneration.jit.compile_forms(
+            [a], parameters={'vectorize': vectorize})
+        integral = compiled_forms[0][0].create_cell_integral(-1)
+        ffi = module.ffi
+        A = np.zeros(256)
+        w = np.linspace(1.0, 2.0, 16)
+        x = np.array(coords)
+        integral.tabulate_tensor(
+            ffi.cast('double *', A.ctypes.data), ffi.cast('double *', w.ctypes.data),
+            ffi.cast('double *', x.ctypes.data), 0)
+        results.append(A)
+
+    assert np.allclose(results[0], results[1])
+
+
+@pytest.mark.parametrize("cell,coords", [
+    (ufl.quadrilateral, [0.0, 0.0, 1.0, 0.0, 0.1, 1.2, 1.3, 1.1]),
+    (ufl.hexahedron, hexahedron_coords),
+])
+@pytest.mark.parametrize("form", ["stiffness", "mass", "linear"])
+def test_sum_factorization(cell, coords, form):
+    element = ufl.VectorElement("Q", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(ufl.FiniteElement("Q", cell, 2))
+    forms = {"stiffness": (g * ufl.inner(ufl.grad(u), ufl.grad(v)) + ufl.div(u) * ufl.div(v)) * ufl.dx,
+             "mass": g * ufl.inner(u, v) * ufl.dx,
+             "linear": (g * v[0] + g * ufl.div(v)) * ufl.dx}
+    a = forms[form]
+
+    # The blocks are sum factorized, summing over one direction at a time
+    parameters = {'enable_tensor_factorization': True}
+    code_h, code_c = ffc.compiler.compile_ufl_objects([a], prefix="sumfact", parameters=parameters)
+    assert "UFLACS block mode: sumfactorized" in code_c
+    assert re.search(r"\bBT\d+\b", code_c) and re.search(r"\bST\d+\b", code_c)
+
+    results = []
+    for enable_tensor_factorization in (0, 1):
+        compiled_forms, module = ffc.codegeneration.jit.compile_forms(
+            [a], parameters={'enable_tensor_factorization': enable_tensor_factorization})
+        integral = compiled_forms[0][0].create_cell_integral(-1)
+        ffi = module.ffi
+        A = np.zeros(81 * 81)
+        w = np.linspace(1.0, 2.0, 27)
+        x = np.array(coords)
+        integral.tabulate_tensor(
+            ffi.cast('double *', A.ctypes.data), ffi.cast('double *', w.ctypes.data),
+            ffi.cast('double *', x.ctypes.data), 0)
+        results.append(A)
+
+    assert np.allclose(results[0], results[1])
+
+
+def test_sum_factorization_linear():
+    cell = ufl.hexahedron
+    element = ufl.FiniteElement("Q", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    g = ufl.Coefficient(element)
+    a = g * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    L = g * v * ufl.dx
+    coords = np.array([0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 1.1, 1.0, 0.0,
+                       0.0, 0.0, 1.0, 1.0, 0.1, 1.0, 0.0, 1.0, 1.2, 1.0, 1.0, 1.1])
+    w = np.linspace(1.0, 2.0, 27)
+    x = np.linspace(-1.0, 1.0, 27)
+
+    # Linear forms and the action of bilinear forms have blocks of rank 1
+    results = []
+    for enable_tensor_factorization in (False, True):
+        parameters = {'tabulate_action': True, 'enable_tensor_factorization': enable_tensor_factorization}
+        compiled_forms, module = ffc.codegeneration.jit.compile_forms([a, L], parameters=parameters)
+        ffi = module.ffi
+
+        def ptr(x):
+            return ffi.cast('double *', x.ctypes.data)
+
+        b = np.zeros(27)
+        compiled_forms[1][0].create_cell_integral(-1).tabulate_tensor(ptr(b), ptr(w), ptr(coords), 0)
+        y = np.zeros(27)
+        compiled_forms[0][0].create_cell_integral(-1).tabulate_action(
+            ptr(y), ptr(np.concatenate((w, x))), ptr(coords), 0)
+        results.append((b, y))
+
+    assert np.allclose(results[0][0], results[1][0])
+    assert np.allclose(results[0][1], results[1][1])
+
+
+def test_interior_facet_coefficients():
+    element = ufl.FiniteElement("DG", ufl.triangle, 0)
+    f, g = ufl.Coefficient(element), ufl.Coefficient(element)
+    M = f('+') * g('-') * ufl.dS
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([M])
+    integral = compiled_forms[0][0].create_interior_facet_integral(-1)
+    ffi = module.ffi
+
+    def ptr(x):
+        return ffi.cast('double *', x.ctypes.data)
+
+    # Shared facet from (1, 0) to (0, 1), facet 0 of the first cell and
+    # facet 2 of the second cell, with w = [f+, f-, g+, g-]
+    coords0 = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0])
+    coords1 = np.array([1.0, 0.0, 0.0, 1.0, 1.0, 1.0])
+    w = np.array([2.0, 3.0, 5.0, 7.0])
+    A = np.zeros(1)
+    integral.tabulate_tensor(ptr(A), ptr(w), ptr(coords0), ptr(coords1), 0, 2, 0, 0)
+    assert np.isclose(A[0], 2.0 * 7.0 * np.sqrt(2.0))
+
+
 def test_subdomains():
     cell = ufl.triangle
     element = ufl.FiniteElement("Lagrange", cell, 1)
@@ -327,3 +621,128 @@ def test_subdomains():
     ids = np.zeros(form3.num_exterior_facet_integrals, dtype=np.int32)
     form3.get_exterior_facet_integral_ids(ffi.cast('int *', ids.ctypes.data))
     assert ids[0] == 0 and ids[1] == 210
+
+
+def test_cache_hit_skips_analysis(tmpdir, monkeypatch):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(u, v) * ufl.dx
+    parameters = {'cache_dir': str(tmpdir)}
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("UFL analysis should not run on a cache hit")
+
+    monkeypatch.setattr(ffc.codegeneration.jit, "analyze_ufl_objects", fail)
+    monkeypatch.setattr(ffc.compiler, "analyze_ufl_objects", fail)
+    cached_forms, cached_module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    assert cached_module is module
+    assert cached_forms[0].rank == compiled_forms[0].rank
+
+
+def test_analysis_shared(tmpdir, monkeypatch):
+    import ffc.analysis
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 2)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    analyzed = []
+    analyze_form = ffc.analysis._analyze_form
+
+    def counting_analyze_form(form, parameters):
+        analyzed.append(form)
+        return analyze_form(form, parameters)
+
+    # Dependency discovery and compilation share one analysis
+    monkeypatch.setattr(ffc.analysis, "_analyze_form", counting_analyze_form)
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters={'cache_dir': str(tmpdir)})
+    assert compiled_forms[0].rank == 2
+    assert analyzed == [a]
+
+
+def test_stale_build_is_reclaimed(tmpdir):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    parameters = ffc.parameters.validate_parameters({'cache_dir': str(tmpdir), 'timeout': 1})
+
+    # Leave a partial build behind as if a builder had crashed
+    module_name = 'libffc_forms_' + ffc.classname.compute_signature([a], '', parameters)
+    tmpdir.join(module_name + ".c").write("")
+    tmpdir.mkdir("libffc-build-" + module_name).join(module_name + ".o").write("")
+
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    assert compiled_forms[0].rank == 2
+    assert not tmpdir.join("libffc-build-" + module_name).exists()
+    assert tmpdir.join(module_name + ".c").size() > 0
+
+
+def test_parallel_dependencies(tmpdir):
+    cell = ufl.triangle
+    P2 = ufl.VectorElement("Lagrange", cell, 2)
+    P1 = ufl.FiniteElement("Lagrange", cell, 1)
+    TH = ufl.MixedElement([P2, P1])
+    (u, p), (v, q) = ufl.TrialFunctions(TH), ufl.TestFunctions(TH)
+    a = (ufl.inner(ufl.grad(u), ufl.grad(v)) - ufl.div(v) * p + q * ufl.div(u)) * ufl.dx
+
+    serial = ffc.parameters.validate_parameters({'cache_dir': str(tmpdir.mkdir("serial"))})
+    parallel = dict(serial, cache_dir=str(tmpdir.mkdir("parallel")), jit_workers=4)
+    serial_deps = ffc.codegeneration.jit.get_ufl_dependencies([a], serial)
+    parallel_deps = ffc.codegeneration.jit.get_ufl_dependencies([a], parallel)
+    assert parallel_deps == serial_deps
+
+    compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parallel)
+    assert compiled_forms[0].rank == 2
+
+
+def test_compile_batch(tmpdir):
+    cell = ufl.triangle
+    P1 = ufl.FiniteElement("Lagrange", cell, 1)
+    P2 = ufl.VectorElement("Lagrange", cell, 2)
+    mesh = ufl.Mesh(ufl.VectorElement("Lagrange", cell, 1))
+    u, v = ufl.TrialFunction(P1), ufl.TestFunction(P1)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    L = v * ufl.dx
+    parameters = {'cache_dir': str(tmpdir)}
+
+    compiled, module = ffc.codegeneration.jit.compile_batch([a, P2, mesh, L], parameters=parameters)
+    form_a, (element, dofmap), cmap, form_L = compiled
+    assert form_a.rank == 2 and form_L.rank == 1
+    assert element.space_dimension == 12 and dofmap.num_element_support_dofs == 12
+    assert cmap.geometric_dimension == 2
+
+    # Dependencies are built into the same library
+    assert form_a.create_finite_element(0).space_dimension == 3
+    assert len(tmpdir.listdir(lambda f: f.ext == ".so")) == 1
+
+    ffi = cffi.FFI()
+    A = np.zeros((3, 3), dtype=np.float64)
+    w = np.array([], dtype=np.float64)
+    coords = np.array([0.0, 0.0, 1.0, 0.0, 0.0, 1.0], dtype=np.float64)
+    integral = form_a.create_cell_integral(-1)
+    integral.tabulate_tensor(ffi.cast('double *', A.ctypes.data), ffi.cast('double *', w.ctypes.data),
+                             ffi.cast('double *', coords.ctypes.data), 0)
+    assert np.allclose(A, [[1.0, -0.5, -0.5], [-0.5, 0.5, 0.0], [-0.5, 0.0, 0.5]])
+
+    cached, cached_module = ffc.codegeneration.jit.compile_batch([a, P2, mesh, L], parameters=parameters)
+    assert cached_module is module
+
+
+def test_optimize_flags(tmpdir):
+    cell = ufl.triangle
+    element = ufl.FiniteElement("Lagrange", cell, 1)
+    u, v = ufl.TrialFunction(element), ufl.TestFunction(element)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    modules = []
+    for flags in ["-O2", "-O3 -funroll-loops"]:
+        parameters = {'cache_dir': str(tmpdir), 'cpp_optimize_flags': flags}
+        compiled_forms, module = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+        assert compiled_forms[0].rank == 2
+        modules.append(module)
+
+    # Each set of flags has its own cache entry
+    assert modules[0].__name__ != modules[1].__name__
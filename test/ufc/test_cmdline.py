@@ -22,3 +22,91 @@ def test_visualise():
     subprocess.run(["ffc", "-f", "visualise", "1", "Poisson.ufl"])
     assert os.path.isfile("S.pdf")
     assert os.path.isfile("F.pdf")
+
+
+def test_incremental(tmpdir):
+    import ffc
+    from ffc.codegeneration import jitcache
+    from ffc.ir.ircache import INTEGRAL_CACHE_DIR
+    ufl_file = tmpdir.join("Incremental.ufl")
+    form = """element = FiniteElement("Lagrange", triangle, 1)
+u = TrialFunction(element)
+v = TestFunction(element)
+f = Coefficient(element)
+a = inner(grad(u), grad(v))*dx + u*v*ds
+L = {}*f*v*dx
+"""
+    args = ["--incremental", "-f", "cache_dir", str(tmpdir.join("cache")), "-o", str(tmpdir)]
+    ufl_file.write(form.format(1))
+    assert ffc.main(args + [str(ufl_file)]) == 0
+    integrals = tmpdir.join("cache", INTEGRAL_CACHE_DIR)
+    assert len(integrals.listdir()) == 3
+
+    # Recompiling unchanged integrals adds no new ones
+    assert ffc.main(args + [str(ufl_file)]) == 0
+    assert len(integrals.listdir()) == 3
+
+    # Only the changed integral is regenerated
+    ufl_file.write(form.format(2))
+    assert ffc.main(args + [str(ufl_file)]) == 0
+    assert len(integrals.listdir()) == 4
+    code = tmpdir.join("Incremental.c").read_binary()
+    assert ffc.main(["-o", str(tmpdir), str(ufl_file)]) == 0
+    # The code is the same as without reuse
+    assert tmpdir.join("Incremental.c").read_binary() == code
+
+    # The integrals are kept within the limits of the JIT cache, least
+    # recently used first out
+    ufl_file.write(form.format(3))
+    assert ffc.main(args + ["-f", "cache_max_entries", "4", str(ufl_file)]) == 0
+    assert len(integrals.listdir()) == 4
+    jitcache.prune(tmpdir.join("cache"), max_entries=3)
+    assert len(integrals.listdir()) == 3
+    assert ffc.main(args + [str(ufl_file)]) == 0
+    assert len(integrals.listdir()) == 3
+
+
+def test_parallel_files(tmpdir, caplog):
+    import logging
+    import ffc
+    files = ["Poisson.ufl", "PoissonDG.ufl", "Symmetry.ufl"]
+    ufl_dir = os.path.dirname(__file__)
+    args = ["-v", "-j", "3", "-o", str(tmpdir)] + [os.path.join(ufl_dir, f) for f in files]
+    with caplog.at_level(logging.INFO, logger="ffc"):
+        assert ffc.main(args) == 0
+    for f in files:
+        assert tmpdir.join(f.replace(".ufl", ".c")).size() > 0
+
+    # Log messages of each file are kept together, in the order of the files
+    prefixes = [r.getMessage().split()[1] for r in caplog.records if r.getMessage().startswith("Compiling ")]
+    assert prefixes == ["Poisson", "PoissonDG", "Symmetry"]
+
+    # A failing file sets the exit status without stopping the others
+    broken = tmpdir.join("Broken.ufl")
+    broken.write("a = undefined*dx\n")
+    assert ffc.main(["-j", "2", "-o", str(tmpdir), str(broken), os.path.join(ufl_dir, "Poisson.ufl")]) == 1
+    assert tmpdir.join("Poisson.c").size() > 0
+
+
+def test_serial_files(tmpdir, caplog):
+    import logging
+    import ffc
+    ufl_dir = os.path.dirname(__file__)
+
+    # A failing file is logged and sets the exit status, the following
+    # files are still compiled
+    broken = tmpdir.join("Broken.ufl")
+    broken.write("a = undefined*dx\n")
+    args = ["-o", str(tmpdir), str(broken), os.path.join(ufl_dir, "Poisson.ufl")]
+    with caplog.at_level(logging.ERROR, logger="ffc"):
+        assert ffc.main(args) == 1
+    assert any(r.getMessage() == "Compiling {} failed".format(broken) for r in caplog.records)
+    assert tmpdir.join("Poisson.c").size() > 0
+
+
+def test_diagonal(tmpdir):
+    import ffc
+    ufl_file = os.path.join(os.path.dirname(__file__), "Poisson.ufl")
+    assert ffc.main(["--diagonal", "-o", str(tmpdir), ufl_file]) == 0
+    code = tmpdir.join("Poisson.c").read()
+    assert "integral->tabulate_diagonal = tabulate_diagonal_" in code
@@ -6,17 +6,80 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
 import ffc
+import ffc.codegeneration.jit
+import ffc.compiler
+from ffc.codegeneration import jitcache
 import os
 import os.path
+import pytest
+import ufl
 
 
 def test_forms():
     os.chdir(os.path.dirname(__file__))
-    ffc.main(["-v", "Poisson.ufl"])
-    ffc.main(["-f", "visualise", "1", "Poisson.ufl"])
-    ffc.main(["-v", "PoissonDG.ufl"])
-    ffc.main(["-v", "Conditional.ufl"])
-    ffc.main(["-v", "HyperElasticity.ufl"])
-    ffc.main(["-v", "VectorLaplaceGradCurl.ufl"])
-    ffc.main(["-v", "ProjectionManifold.ufl"])
-    ffc.main(["-v", "Symmetry.ufl"])
+    assert ffc.main(["-v", "Poisson.ufl"]) == 0
+    assert ffc.main(["-f", "visualise", "1", "Poisson.ufl"]) == 0
+    assert ffc.main(["-v", "PoissonDG.ufl"]) == 0
+    assert ffc.main(["-v", "Conditional.ufl"]) == 0
+    assert ffc.main(["-v", "HyperElasticity.ufl"]) == 0
+    assert ffc.main(["-v", "VectorLaplaceGradCurl.ufl"]) == 0
+    assert ffc.main(["-v", "ProjectionManifold.ufl"]) == 0
+    assert ffc.main(["-v", "Symmetry.ufl"]) == 0
+
+
+def test_prewarm_cache(tmpdir):
+    os.chdir(os.path.dirname(__file__))
+    parameter_file = tmpdir.join("parameters.json")
+    parameter_file.write('{"cpp_optimize_flags": "-O3"}')
+    cache_dir = tmpdir.join("cache")
+    assert ffc.main(["--jit-cache", str(cache_dir), "--jit-parameters", str(parameter_file),
+                     "-f", "jit_workers", "2", "Poisson.ufl"]) == 0
+
+    # Everything in the file is now a cache hit
+    ufd = ufl.algorithms.load_ufl_file("Poisson.ufl")
+    parameters = {"cpp_optimize_flags": "-O3", "cache_dir": str(cache_dir)}
+    hits = jitcache.statistics(cache_dir)["hits"]
+    for form in ufd.forms:
+        ffc.codegeneration.jit.compile_forms([form], parameters=parameters)
+    ffc.codegeneration.jit.compile_elements(ufd.elements, parameters=parameters)
+    stats = jitcache.statistics(cache_dir)
+    assert stats["hits"] == hits + 3
+
+
+def test_prewarm_cache_parameter_types(tmpdir):
+    os.chdir(os.path.dirname(__file__))
+    cache_dir = tmpdir.join("cache")
+    assert ffc.main(["--jit-cache", str(cache_dir), "-f", "cpp_optimize", "0",
+                     "-f", "tabulate_action", "1", "Poisson.ufl"]) == 0
+
+    # Parameters from the command line are cast like the application's
+    ufd = ufl.algorithms.load_ufl_file("Poisson.ufl")
+    parameters = {"cpp_optimize": False, "tabulate_action": True, "cache_dir": str(cache_dir)}
+    misses = jitcache.statistics(cache_dir)["misses"]
+    for form in ufd.forms:
+        ffc.codegeneration.jit.compile_forms([form], parameters=parameters)
+    assert jitcache.statistics(cache_dir)["misses"] == misses
+
+    # Unknown parameters are an error
+    parameter_file = tmpdir.join("parameters.json")
+    parameter_file.write('{"cpp_optimise": false}')
+    with pytest.raises(RuntimeError):
+        ffc.main(["--jit-cache", str(cache_dir), "--jit-parameters", str(parameter_file), "Poisson.ufl"])
+
+
+def test_parallel_ir():
+    os.chdir(os.path.dirname(__file__))
+    ufd = ufl.algorithms.load_ufl_file("VectorLaplaceGradCurl.ufl")
+    serial = ffc.compiler.compile_ufl_objects(ufd.forms, ufd.object_names, prefix="VectorLaplaceGradCurl")
+    parallel = ffc.compiler.compile_ufl_objects(ufd.forms, ufd.object_names, prefix="VectorLaplaceGradCurl",
+                                                parameters={"ir_workers": 2})
+    assert parallel == serial
+
+
+def test_parallel_codegen():
+    os.chdir(os.path.dirname(__file__))
+    ufd = ufl.algorithms.load_ufl_file("VectorLaplaceGradCurl.ufl")
+    serial = ffc.compiler.compile_ufl_objects(ufd.forms, ufd.object_names, prefix="VectorLaplaceGradCurl")
+    parallel = ffc.compiler.compile_ufl_objects(ufd.forms, ufd.object_names, prefix="VectorLaplaceGradCurl",
+                                                parameters={"codegen_workers": 2})
+    assert parallel == serial
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 FEniCS Project
+#
+# This file is part of FFC (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import ffc.codegeneration.jit
+from ffc.codegeneration import jitcache
+import ufl
+
+
+def mixed_element():
+    cell = ufl.triangle
+    P2 = ufl.VectorElement("Lagrange", cell, 2)
+    P1 = ufl.FiniteElement("Lagrange", cell, 1)
+    return ufl.MixedElement([P2, P1])
+
+
+def test_statistics(tmpdir):
+    parameters = {'cache_dir': str(tmpdir)}
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 1)
+    _, module = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+    ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+
+    stats = jitcache.statistics(tmpdir)
+    assert stats["entries"] == 1
+    assert stats["misses"] == 1 and stats["hits"] == 1
+    assert stats["bytes"] > 0
+    assert stats["build_time_saved"] > 0.0
+
+    entry = jitcache.find(tmpdir, module.__name__)
+    assert entry.hits == 1
+    assert entry.build_time > 0.0 and entry.size == stats["bytes"]
+    assert os.path.isfile(entry.path)
+    assert len(entry.symbols) == 2
+
+    assert jitcache.main(["--cache-dir", str(tmpdir), "stats"]) == 0
+
+
+def test_evict_dependents(tmpdir):
+    parameters = {'cache_dir': str(tmpdir)}
+    element = mixed_element()
+    _, module = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+    mixed_name = module.__name__
+
+    entries = jitcache.list_entries(tmpdir)
+    dependencies = entries[mixed_name].dependencies
+    assert len(dependencies) == 3
+    assert all(dep in entries for dep in dependencies)
+
+    # Evicting a sub-element also evicts the mixed element linking to it
+    removed = jitcache.evict(tmpdir, dependencies[0])
+    assert mixed_name in removed
+    assert removed[-1] == dependencies[0]
+    assert not any(f.basename.startswith(mixed_name) for f in tmpdir.listdir())
+
+
+def test_evict_dependents_by_name(tmpdir):
+    # Module names are compared exactly, "_" is not a wildcard
+    names = ["libffc_a_b", "libffc_aXb", "libffc_c"]
+    for name in names:
+        tmpdir.join(name + ".so").write("")
+    jitcache.publish(tmpdir, names[0], tmpdir.join(names[0] + ".so"), [], 1.0, [], "0")
+    jitcache.publish(tmpdir, names[1], tmpdir.join(names[1] + ".so"), [], 1.0, [], "1")
+    jitcache.publish(tmpdir, names[2], tmpdir.join(names[2] + ".so"), [], 1.0, [names[1]], "2")
+    assert jitcache.evict(tmpdir, names[0]) == [names[0]]
+    assert jitcache.evict(tmpdir, names[1]) == [names[2], names[1]]
+
+
+def test_record_hit_without_waiting(tmpdir):
+    tmpdir.join("libffc_a.so").write("")
+    jitcache.publish(tmpdir, "libffc_a", tmpdir.join("libffc_a.so"), [], 1.0, [], "0")
+
+    # A hit is not recorded while another process writes to the index
+    conn = sqlite3.connect(str(tmpdir.join(jitcache.INDEX_FILE)), isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    jitcache.record_hit(tmpdir, "libffc_a")
+    conn.execute("ROLLBACK")
+    assert jitcache.statistics(tmpdir)["hits"] == 0
+
+    jitcache.record_hit(tmpdir, "libffc_a")
+    assert jitcache.statistics(tmpdir)["hits"] == 1
+
+
+def test_prune_least_recently_used(tmpdir):
+    parameters = {'cache_dir': str(tmpdir)}
+    elements = [ufl.FiniteElement("Lagrange", ufl.triangle, p) for p in range(1, 4)]
+    names = []
+    for element in elements:
+        _, module = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+        names.append(module.__name__)
+
+    # Use the first element again, making the second the oldest
+    ffc.codegeneration.jit.compile_elements(elements[:1], parameters=parameters)
+
+    removed = jitcache.prune(tmpdir, max_entries=2)
+    assert removed == [names[1]]
+    assert sorted(jitcache.list_entries(tmpdir)) == sorted([names[0], names[2]])
+
+    # Limits are applied automatically after each build
+    parameters['cache_max_entries'] = 1
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 4)
+    _, module = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+    assert list(jitcache.list_entries(tmpdir)) == [module.__name__]
+
+
+def test_clear(tmpdir):
+    parameters = {'cache_dir': str(tmpdir)}
+    ffc.codegeneration.jit.compile_elements([mixed_element()], parameters=parameters)
+    tmpdir.mkdir(jitcache.BUILD_DIR_PREFIX + "libffc_elements_0")
+    assert jitcache.main(["--cache-dir", str(tmpdir), "clear"]) == 0
+    assert not any(f.basename.startswith(("libffc_", jitcache.BUILD_DIR_PREFIX)) for f in tmpdir.listdir())
+    assert jitcache.list_entries(tmpdir) == {}
+    assert jitcache.statistics(tmpdir)["hits"] == 0
+
+
+def test_deduplicate_identical_code(tmpdir):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    parameters = {'cache_dir': str(tmpdir)}
+
+    # A batch of one element has its own signature but the same code
+    _, module0 = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+    compiled, module1 = ffc.codegeneration.jit.compile_batch([element], parameters=parameters)
+    assert module1 is module0
+    assert compiled[0][0].space_dimension == 6
+    assert jitcache.statistics(tmpdir)["deduplicated"] == 1
+
+    aliases = [e for e in jitcache.list_entries(tmpdir).values() if e.name != e.module]
+    assert len(aliases) == 1 and aliases[0].module == module0.__name__
+
+    # The alias is found on later lookups
+    compiled, module2 = ffc.codegeneration.jit.compile_batch([element], parameters=parameters)
+    assert module2 is module0
+
+    # Evicting the module also evicts its alias
+    removed = jitcache.evict(tmpdir, module0.__name__)
+    assert aliases[0].name in removed
+
+
+def test_deduplicate_renamed_objects(tmpdir):
+    element = ufl.FiniteElement("Lagrange", ufl.triangle, 2)
+    a = ufl.TrialFunction(element) * ufl.TestFunction(element) * ufl.dx
+
+    # A parameter not changing the code changes the signatures in the
+    # object names only, the objects keep the names of the first module
+    parameters = {'cache_dir': str(tmpdir), 'crosslink': False}
+    _, module0 = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    parameters['table_rtol'] = 1e-7
+    compiled, module1 = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    assert module1 is module0
+    assert compiled[0][0].rank == 2
+    assert jitcache.statistics(tmpdir)["deduplicated"] == 1
+
+    # Later lookups of the alias load the objects of the first module
+    compiled, module2 = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    assert module2 is module0
+    assert compiled[0][0].rank == 2
+
+    # Elements are linked to under their own names, so they are built
+    _, module3 = ffc.codegeneration.jit.compile_elements([element], parameters={'cache_dir': str(tmpdir)})
+    _, module4 = ffc.codegeneration.jit.compile_elements([element], parameters=parameters)
+    assert module4 is not module3
+    assert jitcache.statistics(tmpdir)["deduplicated"] == 1
+
+    # A form linking to them is built too, its linked libraries differ
+    parameters['crosslink'] = True
+    compiled, module5 = ffc.codegeneration.jit.compile_forms([a], parameters=parameters)
+    assert compiled[0][0].rank == 2
+
+
+def test_ir_cache(tmpdir, monkeypatch):
+    import ffc.compiler
+    import ffc.ir.representation
+    from ffc.ir.ircache import IR_CACHE_DIR
+    parameters = {'cache_dir': str(tmpdir), 'ir_cache': True}
+    element = mixed_element()
+    mesh = ufl.Mesh(ufl.VectorElement("Lagrange", ufl.triangle, 1))
+
+    code0 = ffc.compiler.compile_ufl_objects([element], prefix="ir", parameters=dict(parameters))
+    # Element and dofmap of the mixed, vector P2, P2 and P1 elements,
+    # next to FIAT elements and tabulations
+    ir_files = [f for f in tmpdir.join(IR_CACHE_DIR).listdir() if "-" not in f.basename]
+    assert len(ir_files) == 8
+    mesh_code0 = ffc.compiler.compile_ufl_objects([mesh], prefix="ir", parameters=dict(parameters))
+
+    # The cached representations give the same code, without computing
+    # them again
+    def fail(*args):
+        raise RuntimeError("Representation not loaded from IR cache")
+
+    for name in ["_compute_element_data", "_compute_dofmap_data", "_compute_coordinate_mapping_data"]:
+        monkeypatch.setattr(ffc.ir.representation, name, fail)
+    code1 = ffc.compiler.compile_ufl_objects([element], prefix="ir", parameters=dict(parameters))
+    assert code1 == code0
+    mesh_code1 = ffc.compiler.compile_ufl_objects([mesh], prefix="ir", parameters=dict(parameters))
+    assert mesh_code1 == mesh_code0
+    monkeypatch.undo()
+
+    assert jitcache.main(["--cache-dir", str(tmpdir), "clear"]) == 0
+    assert not tmpdir.join(IR_CACHE_DIR).exists()
+
+
+def test_lazy_imports():
+    # Loading a module from the JIT cache should not import the compiler
+    code = ("import sys, ffc.codegeneration.jit; "
+            "print(' '.join(m for m in {} if m in sys.modules))")
+    heavy = ("cffi", "FIAT", "numpy", "ufl", "ffc.analysis", "ffc.compiler", "ffc.fiatinterface",
+             "ffc.ir.representation")
+    output = subprocess.check_output([sys.executable, "-c", code.format(heavy)])
+    assert output.decode().split() == []
+
+    heavy = ("cffi", "FIAT", "numpy", "ufl")
+    output = subprocess.check_output([sys.executable, "-c", code.replace(".codegeneration.jit", "").format(heavy)])
+    assert output.decode().split() == []